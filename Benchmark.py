@@ -0,0 +1,107 @@
+"""
+Benchmarks for the engine internals, run this file to print the results
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+
+import Engine
+import SmartMoveFinder
+import TranspositionTable
+
+IMPORT_TIME_TARGET = 0.020  # seconds for a fresh process to import the engine and the search, cold start of a worker
+SEARCH_FEN = "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"  # Italian game
+
+
+def get_benchmark_positions(games=4, plies=60, seed=1):
+    # positions from seeded random games, the same list every run
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(games):
+        gamestate = Engine.GameState()
+        for _ in range(plies):
+            legal_moves = gamestate.get_legal_moves()
+            if not legal_moves:
+                break
+            positions.append(([move for move in gamestate.move_log], legal_moves))
+            gamestate.make_move(legal_moves[rng.randint(0, len(legal_moves) - 1)])
+    return positions
+
+
+def bench_make_undo(repeats=20):
+    # make and undo every legal move of every benchmark position, returns make/undo pairs per second
+    pairs = 0
+    elapsed = 0
+    for move_log, legal_moves in get_benchmark_positions():
+        gamestate = Engine.GameState()
+        for move in move_log:
+            gamestate.make_move(move)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for move in legal_moves:
+                gamestate.make_move(move)
+                gamestate.undo_move()
+        elapsed += time.perf_counter() - start
+        pairs += repeats * len(legal_moves)
+    return pairs / elapsed
+
+
+def bench_import(modules=('Engine', 'SmartMoveFinder'), repeats=5):
+    # median import time of the modules in a fresh interpreter, from python's -X importtime report
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+                                capture_output=True, text=True, check=True)
+        microseconds = 0
+        for line in result.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() in modules and not fields[2].startswith('  '):
+                microseconds += int(fields[1])  # cumulative time, includes what the module imports itself
+        times.append(microseconds / 1e6)
+    return sorted(times)[repeats // 2]
+
+
+def bench_parallel_search(max_workers, depth=6, fen=SEARCH_FEN):
+    # the same fixed depth search with 1 to max_workers processes, returns [(workers, seconds, boardstates, move)]
+    SmartMoveFinder.print_best_moves = False
+    results = []
+    for workers in range(1, max_workers + 1):
+        gamestate = Engine.GameState.from_fen(fen)
+        gamestate.in_opening = False
+        # a fresh table and fresh counters, so no run starts from what the one before learned
+        SmartMoveFinder.transposition_table = TranspositionTable.TranspositionTable(SmartMoveFinder.TT_MEGABYTES)
+        SmartMoveFinder.transposition_table.new_search()
+        SmartMoveFinder.new_move_ordering()
+        SmartMoveFinder.reset_search_stats()
+        start = time.perf_counter()
+        move, _ = SmartMoveFinder.find_move_parallel(gamestate, gamestate.get_legal_moves(), depth, workers=workers)
+        elapsed = time.perf_counter() - start
+        results.append((workers, elapsed, SmartMoveFinder.counter + SmartMoveFinder.quiescence_counter,
+                        move.get_notation()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the engine internals")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="also report how the search scales from 1 to this many processes, 0 for none")
+    parser.add_argument("--depth", type=int, default=6, help="depth of the parallel search report")
+    args = parser.parse_args()
+    print("make/undo: %.0f pairs per second" % bench_make_undo())
+    import_time = bench_import()
+    print("import: %.1f ms, target %.1f ms %s" % (import_time * 1000, IMPORT_TIME_TARGET * 1000,
+                                                  "ok" if import_time <= IMPORT_TIME_TARGET else "SLOW"))
+    if args.workers:
+        print("parallel search, depth %d, %d cpus" % (args.depth, os.cpu_count()))
+        single_time = None
+        for workers, elapsed, nodes, move in bench_parallel_search(args.workers, args.depth):
+            single_time = single_time or elapsed
+            print("%2d workers: %6.2fs %9d boardstates %8.0f nps, speedup %.2fx, best move %s" %
+                  (workers, elapsed, nodes, nodes / max(elapsed, 1e-9), single_time / elapsed, move))
+
+
+if __name__ == "__main__":
+    main()
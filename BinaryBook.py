@@ -0,0 +1,190 @@
+"""
+Binary opening book built from PGN games, read through mmap
+- the book file is a sorted array of (zobrist key, move, weight) records, packed as '>QHH'
+- a lookup is a binary search on the mapped file, nothing is loaded up front, and processes reading
+  the same book share the pages
+- moves are 16 bits: start square | end square << 6 | promotion piece << 12, squares are row * 8 + col
+- run this file to build a book: python BinaryBook.py games.pgn [more.pgn ...] -o books/book.bin
+"""
+import argparse
+import mmap
+import os
+import re
+import struct
+
+import Engine
+
+RECORD = struct.Struct('>QHH')  # zobrist key, move, weight
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books', 'book.bin')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+pgn_tokens = re.compile(r'[{}()]|;.*|[^\s{}();]+')
+move_number = re.compile(r'^\d+\.+')
+san_pattern = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+def encode_move(move):
+    start = move.start_row * 8 + move.start_col
+    end = move.end_row * 8 + move.end_col
+    return start | end << 6 | abs(move.promote_to) << 12
+
+
+"""
+Building
+"""
+
+
+def read_pgn_games(lines):
+    # yields the SAN moves of every game, comments, variations and annotations are skipped
+    moves = []
+    comment = False
+    variation = 0
+    for line in lines:
+        if not comment and (line.startswith('[') or line.startswith('%')):  # tag pair or escaped line
+            continue
+        for token in pgn_tokens.findall(line):
+            if comment:
+                comment = token != '}'
+            elif token == '{':
+                comment = True
+            elif token == '(':
+                variation += 1
+            elif token == ')':
+                variation -= 1
+            elif variation or token[0] in ';$':
+                continue
+            elif token in RESULTS:
+                if moves:
+                    yield moves
+                moves = []
+            else:
+                token = move_number.sub('', token)
+                if token and token != 'e.p.':
+                    moves.append(token)
+    if moves:
+        yield moves
+
+
+def get_san_move(gamestate, san):
+    # the legal move the SAN stands for, None if there isn't one
+    san = san.rstrip('+#!?')
+    legal_moves = gamestate.get_legal_moves()
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        end_col = 6 if len(san) == 3 else 2
+        for move in legal_moves:
+            if move.is_castle_move and move.end_col == end_col:
+                return move
+        return None
+    match = san_pattern.match(san)
+    if match is None:
+        return None
+    piece, file, rank, square, promotion = match.groups()
+    piece_type = Engine.fen_to_piece[piece] if piece else 1
+    end_row = Engine.ranks_to_rows[square[1]]
+    end_col = Engine.files_to_cols[square[0]]
+    promote_to = Engine.fen_to_piece[promotion] if promotion else 0
+    for move in legal_moves:
+        if abs(move.piece_moved) == piece_type and move.end_row == end_row and move.end_col == end_col and \
+                abs(move.promote_to) == promote_to and not move.is_castle_move and \
+                (file is None or move.start_col == Engine.files_to_cols[file]) and \
+                (rank is None or move.start_row == Engine.ranks_to_rows[rank]):
+            return move
+    return None
+
+
+def build_book(pgn_paths, book_path=BOOK_PATH, max_plies=24, min_games=1):
+    # counts every (position, move) of the first max_plies of the games, returns (games, positions, records)
+    counts = {}
+    games = 0
+    gamestate = Engine.GameState()
+    for path in pgn_paths:
+        with open(path, encoding='utf-8', errors='replace') as pgn:
+            for sans in read_pgn_games(pgn):
+                for san in sans[:max_plies]:
+                    move = get_san_move(gamestate, san)
+                    if move is None:
+                        break  # unreadable or illegal, the game is used up to here
+                    entry = (gamestate.zobrist_key, encode_move(move))
+                    counts[entry] = counts.get(entry, 0) + 1
+                    gamestate.make_move(move)
+                while gamestate.move_log:
+                    gamestate.undo_move()
+                games += 1
+    records = sorted((key, move, min(count, 0xFFFF)) for (key, move), count in counts.items() if count >= min_games)
+    directory = os.path.dirname(book_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(book_path, 'wb') as book:
+        for record in records:
+            book.write(RECORD.pack(*record))
+    return games, len({record[0] for record in records}), len(records)
+
+
+"""
+Reading
+"""
+
+
+class BinaryBook:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.path.getsize(path)
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.records = size // RECORD.size
+
+    def get_entries(self, key):
+        # [(move, weight), ...] for the key, a binary search for the first record and a scan over the rest
+        low = 0
+        high = self.records
+        while low < high:
+            mid = (low + high) // 2
+            if RECORD.unpack_from(self.data, mid * RECORD.size)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        entries = []
+        while low < self.records:
+            record_key, move, weight = RECORD.unpack_from(self.data, low * RECORD.size)
+            if record_key != key:
+                break
+            entries.append((move, weight))
+            low += 1
+        return entries
+
+    def get_book_moves(self, gamestate):
+        # [(move, weight), ...] with the legal moves of the position, so a key collision can't play a wrong move
+        entries = dict(self.get_entries(gamestate.zobrist_key))
+        if not entries:
+            return []
+        return [(move, entries[encode_move(move)]) for move in gamestate.get_legal_moves()
+                if encode_move(move) in entries]
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+
+binary_book = None  # opened on first use, False if there is no book file
+
+
+def get_binary_book():
+    global binary_book
+    if binary_book is None:
+        binary_book = BinaryBook(BOOK_PATH) if os.path.exists(BOOK_PATH) else False
+    return binary_book or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a binary opening book from PGN files")
+    parser.add_argument("pgn", nargs='+')
+    parser.add_argument("-o", "--output", default=BOOK_PATH)
+    parser.add_argument("--plies", type=int, default=24, help="book moves taken from the start of every game")
+    parser.add_argument("--min-games", type=int, default=1, help="drop moves played in fewer games than this")
+    args = parser.parse_args()
+    games, positions, records = build_book(args.pgn, args.output, args.plies, args.min_games)
+    print("%d games, %d positions, %d moves written to %s" % (games, positions, records, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Bitboard move generation, a reference generator to check GameState.get_legal_moves against
+- not a faster board, the bitboards are rebuilt from the mailbox on every call and make_move/undo_move
+  don't keep them, so perft with --bitboards runs about 1.6x slower than the list-of-lists generator
+- squares are numbered row * 8 + col like the zobrist keys, so a8 = 0 and h1 = 63
+- a bitboard is a python int with bit n set if square n is occupied
+- moves come out in the same order as the list-of-lists generator in Engine, except check evasions, which
+  Engine lists by target square, so the parity check compares sorted move lists, and a DETERMINISTIC search
+  can pick a different move between equal scores with use_bitboards set
+"""
+import random
+
+import Engine
+import Mailbox
+
+FULL_BOARD = (1 << 64) - 1
+
+# direction orders copied from the Engine generators, so that both generators list most moves in the same order
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+QUEEN_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1), (1, 0), (-1, 0), (0, 1), (0, -1))
+KNIGHT_STEPS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (-1, 2), (1, -2), (-1, -2))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def get_steps(sq, steps):
+    row, col = divmod(sq, 8)
+    return tuple((row + dr) * 8 + col + dc for dr, dc in steps if 0 <= row + dr < 8 and 0 <= col + dc < 8)
+
+
+def get_ray(sq, direction):
+    row, col = divmod(sq, 8)
+    ray = []
+    for i in range(1, 8):
+        new_row = row + direction[0] * i
+        new_col = col + direction[1] * i
+        if not (0 <= new_row < 8 and 0 <= new_col < 8):
+            break
+        ray.append(new_row * 8 + new_col)
+    return tuple(ray)
+
+
+def to_bitboard(squares):
+    bitboard = 0
+    for sq in squares:
+        bitboard |= 1 << sq
+    return bitboard
+
+
+# leaper targets in generator order, and as bitboards for attack tests
+KNIGHT_TARGETS = [get_steps(sq, KNIGHT_STEPS) for sq in range(64)]
+KING_TARGETS = [get_steps(sq, KING_STEPS) for sq in range(64)]
+KNIGHT_ATTACKS = [to_bitboard(targets) for targets in KNIGHT_TARGETS]
+KING_ATTACKS = [to_bitboard(targets) for targets in KING_TARGETS]
+# squares attacked by a pawn of that colour standing on the square
+PAWN_ATTACKS = {1: [to_bitboard(get_steps(sq, ((-1, -1), (-1, 1)))) for sq in range(64)],
+                -1: [to_bitboard(get_steps(sq, ((1, -1), (1, 1)))) for sq in range(64)]}
+
+# rays from every square in every direction, the squares ordered outwards from the square
+RAY_SQUARES = {d: [get_ray(sq, d) for sq in range(64)] for d in QUEEN_DIRECTIONS}
+RAYS = {d: [to_bitboard(ray) for ray in RAY_SQUARES[d]] for d in QUEEN_DIRECTIONS}
+# the first blocker on a ray is the lowest set bit when the square numbers grow along the ray, else the highest
+RAY_GROWS = {d: d[0] * 8 + d[1] > 0 for d in QUEEN_DIRECTIONS}
+
+# squares strictly between two squares on a common line, 0 if they don't share one
+BETWEEN = [[0] * 64 for _ in range(64)]
+for start in range(64):
+    for d in QUEEN_DIRECTIONS:
+        between = 0
+        for end in RAY_SQUARES[d][start]:
+            BETWEEN[start][end] = between
+            between |= 1 << end
+
+
+def get_ray_attacks(sq, direction, occupied):
+    ray = RAYS[direction][sq]
+    blockers = ray & occupied
+    if blockers:
+        first = (blockers & -blockers).bit_length() - 1 if RAY_GROWS[direction] else blockers.bit_length() - 1
+        ray ^= RAYS[direction][first]  # cut the ray off behind the first blocker
+    return ray
+
+
+def get_rook_attacks(sq, occupied):
+    return get_ray_attacks(sq, (1, 0), occupied) | get_ray_attacks(sq, (-1, 0), occupied) | \
+           get_ray_attacks(sq, (0, 1), occupied) | get_ray_attacks(sq, (0, -1), occupied)
+
+
+def get_bishop_attacks(sq, occupied):
+    return get_ray_attacks(sq, (1, 1), occupied) | get_ray_attacks(sq, (1, -1), occupied) | \
+           get_ray_attacks(sq, (-1, 1), occupied) | get_ray_attacks(sq, (-1, -1), occupied)
+
+
+def get_squares(bitboard):
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+def get_bitboards(mailbox):
+    pieces = {piece: 0 for piece in Engine.int_to_string if piece != 0}
+    for index, sq in enumerate(Mailbox.SQUARES):
+        if mailbox[sq] != 0:
+            pieces[mailbox[sq]] |= 1 << index
+    return pieces
+
+
+def get_attackers(sq, color, occupied, pieces):
+    # all pieces of the color attacking the square, sliders see through nothing but the given occupancy
+    return (KNIGHT_ATTACKS[sq] & pieces[3 * color]) | (KING_ATTACKS[sq] & pieces[6 * color]) | \
+           (PAWN_ATTACKS[-color][sq] & pieces[color]) | \
+           (get_rook_attacks(sq, occupied) & (pieces[2 * color] | pieces[5 * color])) | \
+           (get_bishop_attacks(sq, occupied) & (pieces[4 * color] | pieces[5 * color]))
+
+
+def get_legal_moves(gamestate):
+    mailbox = gamestate.mailbox
+    pieces = get_bitboards(mailbox)
+    ally = 1 if gamestate.white_to_move else -1
+    enemy = -ally
+    ours = 0
+    theirs = 0
+    for piece in range(1, 7):
+        ours |= pieces[piece * ally]
+        theirs |= pieces[piece * enemy]
+    occupied = ours | theirs
+    king_sq = (pieces[6 * ally] & -pieces[6 * ally]).bit_length() - 1
+    checkers = get_attackers(king_sq, enemy, occupied, pieces)
+    gamestate.in_check = checkers != 0
+    double_check = checkers & (checkers - 1) != 0
+
+    # non-king moves have to land on these squares, block or capture a single checker
+    allowed = FULL_BOARD & ~ours
+    if checkers:
+        checker_sq = checkers.bit_length() - 1
+        allowed &= checkers | BETWEEN[king_sq][checker_sq]
+
+    # pinned pieces can only move along the line between the king and the pinner
+    pin_lines = {}
+    snipers = (get_rook_attacks(king_sq, 0) & (pieces[2 * enemy] | pieces[5 * enemy])) | \
+              (get_bishop_attacks(king_sq, 0) & (pieces[4 * enemy] | pieces[5 * enemy]))
+    for sniper_sq in get_squares(snipers):
+        blockers = BETWEEN[king_sq][sniper_sq] & occupied
+        if blockers and not blockers & (blockers - 1) and blockers & ours:
+            pin_lines[blockers.bit_length() - 1] = BETWEEN[king_sq][sniper_sq] | 1 << sniper_sq
+
+    moves = []
+    for sq in get_squares(ours):
+        piece = mailbox[Mailbox.SQUARES[sq]] * ally
+        if piece == 6:
+            get_king_moves(gamestate, sq, ours, occupied, pieces, checkers, moves)
+        elif not double_check:
+            targets = allowed & pin_lines.get(sq, FULL_BOARD)
+            if piece == 1:
+                get_pawn_moves(gamestate, sq, targets, theirs, occupied, pieces, king_sq, moves)
+            elif piece == 3:
+                for end in KNIGHT_TARGETS[sq]:
+                    if targets >> end & 1:
+                        moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[end], mailbox))
+            else:
+                directions = ROOK_DIRECTIONS if piece == 2 else BISHOP_DIRECTIONS if piece == 4 else QUEEN_DIRECTIONS
+                for d in directions:
+                    attacks = get_ray_attacks(sq, d, occupied) & targets
+                    if attacks:
+                        for end in RAY_SQUARES[d][sq]:
+                            if attacks >> end & 1:
+                                moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[end], mailbox))
+
+    if not moves:  # either checkmate or stalemate
+        if gamestate.in_check:
+            gamestate.checkmate = True
+        else:
+            gamestate.draw = True
+    else:
+        gamestate.checkmate = False
+        gamestate.draw = False
+    return moves
+
+
+def get_pawn_moves(gamestate, sq, targets, theirs, occupied, pieces, king_sq, moves):
+    mailbox = gamestate.mailbox
+    ally = 1 if gamestate.white_to_move else -1
+    row, col = divmod(sq, 8)
+    direction = -1 if ally == 1 else 1
+    one_step = sq + 8 * direction
+    if not occupied >> one_step & 1:
+        if targets >> one_step & 1:
+            if row + direction == 0 or row + direction == 7:  # promotion
+                for promotion in (5, 4, 3, 2):
+                    moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[one_step], mailbox,
+                                                  promote_to=promotion * ally))
+            else:
+                moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[one_step], mailbox))
+        two_steps = one_step + 8 * direction
+        if row == (6 if ally == 1 else 1) and not occupied >> two_steps & 1 and targets >> two_steps & 1:
+            moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[two_steps], mailbox))
+    for side in (1, -1):
+        if not 0 <= col + side < 8:
+            continue
+        end = one_step + side
+        if theirs >> end & 1:
+            if targets >> end & 1:
+                if row + direction == 0 or row + direction == 7:  # capture and promotion
+                    for promotion in (5, 4, 3, 2):
+                        moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[end], mailbox,
+                                                     promote_to=promotion * ally))
+                else:
+                    moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[end], mailbox))
+        elif (row + direction, col + side) == gamestate.en_passant_possible:
+            # both pawns leave their squares, so test the king against the board after the capture
+            captured_sq = sq + side
+            occupied_after = (occupied ^ (1 << sq) ^ (1 << captured_sq)) | 1 << end
+            if not get_attackers(king_sq, -ally, occupied_after, pieces) & ~(1 << captured_sq):
+                moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[end], mailbox,
+                                             en_passant_possible=True))
+
+
+def get_king_moves(gamestate, sq, ours, occupied, pieces, checkers, moves):
+    mailbox = gamestate.mailbox
+    ally = 1 if gamestate.white_to_move else -1
+    occupied_without_king = occupied ^ (1 << sq)  # so the king can't hide behind itself on a checking ray
+    for end in KING_TARGETS[sq]:
+        if not ours >> end & 1 and not get_attackers(end, -ally, occupied_without_king, pieces):
+            moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[end], mailbox))
+    if checkers:
+        return  # can't castle while in check
+    castle_rights = gamestate.castle_rights
+    if castle_rights.wks if ally == 1 else castle_rights.bks:
+        if not occupied >> (sq + 1) & 1 and not occupied >> (sq + 2) & 1 and \
+                not get_attackers(sq + 1, -ally, occupied, pieces) and not get_attackers(sq + 2, -ally, occupied, pieces):
+            moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[sq + 2], mailbox, is_castle_move=True))
+    if castle_rights.wqs if ally == 1 else castle_rights.bqs:
+        if not occupied >> (sq - 1) & 1 and not occupied >> (sq - 2) & 1 and not occupied >> (sq - 3) & 1 and \
+                not get_attackers(sq - 1, -ally, occupied, pieces) and not get_attackers(sq - 2, -ally, occupied, pieces):
+            moves.append(Engine.get_move(Mailbox.SQUARES[sq], Mailbox.SQUARES[sq - 2], mailbox, is_castle_move=True))
+
+
+"""
+Parity with the list-of-lists generator
+"""
+
+
+def get_move_list(moves):
+    # sorted, the list generator's check evasions come out in target square order
+    return sorted((move.move_ID, move.promote_to, move.is_en_passant, move.is_castle_move) for move in moves)
+
+
+def check_parity(gamestate, depth):
+    # perft with both generators, the move lists have to match at every node (gamestate uses the list generator)
+    list_moves = gamestate.get_legal_moves()
+    bitboard_moves = get_legal_moves(gamestate)
+    if get_move_list(list_moves) != get_move_list(bitboard_moves):
+        raise RuntimeError("Generators disagree after " + ' '.join(move.get_notation() for move in gamestate.move_log))
+    if depth == 1:
+        return len(list_moves)
+    nodes = 0
+    for move in list_moves:
+        gamestate.make_move(move)
+        nodes += check_parity(gamestate, depth - 1)
+        gamestate.undo_move()
+    return nodes
+
+
+def check_parity_random_games(games, seed=0):
+    # play random games to the end, comparing the generators after every move
+    rng = random.Random(seed)
+    positions = 0
+    for _ in range(games):
+        gamestate = Engine.GameState()
+        while len(gamestate.move_log) < 300:
+            list_moves = gamestate.get_legal_moves()
+            if get_move_list(list_moves) != get_move_list(get_legal_moves(gamestate)):
+                raise RuntimeError("Generators disagree after " + ' '.join(move.get_notation() for move in gamestate.move_log))
+            positions += 1
+            if not list_moves:
+                break
+            gamestate.make_move(list_moves[rng.randint(0, len(list_moves) - 1)])
+    return positions
+
+
+if __name__ == "__main__":
+    start_position = Engine.GameState()
+    for perft_depth, expected in ((1, 20), (2, 400), (3, 8902)):
+        print("perft", perft_depth, check_parity(start_position, perft_depth), "expected", expected)
+    print(check_parity_random_games(20), "positions from random games match")
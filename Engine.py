@@ -1,28 +1,41 @@
 """
 Contains game logic and AI
+- headless, nothing here needs a screen, so the search processes and the perft/benchmark scripts run anywhere
+- the Bitboards reference generator is only imported when a GameState asks for it
 """
 import random
 import SmartMoveFinder
+import Mailbox
 
-from win32api import GetSystemMetrics
-
-WIDTH = GetSystemMetrics(0)
-HEIGHT = GetSystemMetrics(1)
-BOARDGAP = HEIGHT // 10
-SQ_SIZE = (HEIGHT - 2 * BOARDGAP) // 8
 int_to_string = {0: '--', 1: 'wp', 2: 'wr', 3: 'wn', 4: 'wb', 5: 'wq', 6: 'wk',
                  -1: 'bp', -2: 'br', -3: 'bn', -4: 'bb', -5: 'bq', -6: 'bk'}
 
+# Zobrist hashing, the random numbers are seeded so that keys are the same in every process and every run
+ZOBRIST_DEBUG = False  # check the incremental key against a full recompute after every make/undo
+zobrist_random = random.Random(2022)
+zobrist_pieces = {piece: [zobrist_random.getrandbits(64) for _ in range(64)] for piece in int_to_string if piece != 0}
+zobrist_castling = [zobrist_random.getrandbits(64) for _ in range(16)]  # indexed by CastleRights.get_bits()
+zobrist_en_passant = [zobrist_random.getrandbits(64) for _ in range(8)]  # indexed by file
+zobrist_black_to_move = zobrist_random.getrandbits(64)
+
+# material value of every piece, positive for white and negative for black
+piece_material = {piece: SmartMoveFinder.piece_values[abs(piece)] * (1 if piece > 0 else -1)
+                  for piece in int_to_string if piece != 0}
+# piece values in an exchange, the king is worth more than anything so it only captures on an undefended square
+exchange_values = {piece: value if piece != 6 else 100 for piece, value in SmartMoveFinder.piece_values.items()}
+ENDGAME_PIECES = 5  # endgame when at most this many non-pawn pieces are left, kings included
+
+# make_move saves what undo_move can't get back from the move in a record on the undo stack:
+# [castling bits, en passant square, captured piece, zobrist key, halfmove clock], all from before the move
+UNDO_STACK_SIZE = 512  # records allocated up front, the stack grows if a game gets longer
+
 
 class GameState:
-    def __init__(self, width, height, sq_size, games_won):
-        self.width = width
-        self.height = height
-        self.squaresize = sq_size
-        # TODO: change all pieces to integers for faster calculation
+    def __init__(self, games_won=(0, 0), use_bitboards=False):
         # white - positive, black - negative
         # empty = 0, pawn = 1, rook = 2, knight = 3, bishop = 4, queen = 5, king = 6
-        self.board = [
+        # the pieces live in a flat 10x12 mailbox, board[row][col] still works through a view on top of it
+        self.mailbox = Mailbox.new_mailbox([
             [-2,-3,-4,-5,-6,-4,-3,-2],
             [-1,-1,-1,-1,-1,-1,-1,-1],
             [0, 0, 0, 0, 0, 0, 0, 0],
@@ -31,11 +44,15 @@ class GameState:
             [0, 0, 0, 0, 0, 0, 0, 0],
             [1, 1, 1, 1, 1, 1, 1, 1],
             [2, 3, 4, 5, 6, 4, 3, 2]
-        ]
+        ])
+        self.board = Mailbox.BoardView(self.mailbox)
         self.legal_moves = []
         self.move_log = []
+        self.null_move_log = []  # (ply, en passant square, zobrist key) of every null move the search has made
         self.opening = ''
         self.material_balance = 0  # negative = black is up material
+        self.piece_counts = {}  # number of pieces of each type on the board
+        self.non_pawn_pieces = 0
         self.games_won = [games_won[0], games_won[1]]  # for ALAP testing
         self.white_to_move = True
         self.in_opening = True
@@ -43,27 +60,43 @@ class GameState:
         self.white_king = (7, 4)
         self.black_king = (0, 4)
         self.castle_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [(CastleRights(self.castle_rights.wks, self.castle_rights.bks,
-                                               self.castle_rights.wqs, self.castle_rights.bqs))]
         self.flip_board = False
         self.in_check = False
         self.pins = []
         self.checks = []
         self.en_passant_possible = ()  # the square where en passant is possible
+        self.halfmove_clock = 0  # moves since the last capture or pawn move
+        self.start_ply = 0  # plies before the first move of the move log, set from a FEN fullmove number
+        self.undo_stack = [[0, (), 0, 0, 0] for _ in range(UNDO_STACK_SIZE)]
         self.checkmate = False
         self.draw = False
         self.promote_to = 5 if self.white_to_move else -5
-        self.boardstates_log = []
         self.states_depth_log = []
         self.eval_log = [0]
+        self.use_bitboards = use_bitboards  # generate moves with the Bitboards reference generator, to check this one
+        self.count_material()  # kept up to date by make_move and undo_move from then on
+        self.zobrist_key = self.compute_zobrist_key()  # position identity, used for repetitions and hashing
+        self.position_counts = {self.zobrist_key: 1}  # times each position occurred, for threefold repetition
 
     """
     MOVE
     """
 
     def make_move(self, move):
-        self.board[move.start_row][move.start_col] = 0
-        self.board[move.end_row][move.end_col] = move.piece_moved
+        # save the state the move can't restore by itself
+        ply = len(self.move_log)
+        if ply == len(self.undo_stack):
+            self.undo_stack.append([0, (), 0, 0, 0])
+        record = self.undo_stack[ply]
+        record[0] = self.castle_rights.get_bits()
+        record[1] = self.en_passant_possible
+        record[2] = move.piece_captured
+        record[3] = self.zobrist_key
+        record[4] = self.halfmove_clock
+
+        mailbox = self.mailbox
+        mailbox[move.start_sq] = 0
+        mailbox[move.end_sq] = move.piece_moved
         self.move_log.append(move)
         self.white_to_move = not self.white_to_move
         # update the king location
@@ -74,7 +107,7 @@ class GameState:
 
         # pawn promotion
         if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.promote_to
+            mailbox[move.end_sq] = move.promote_to
 
         # update en passant possible variable
         if abs(move.piece_moved) == 1 and abs(move.start_row - move.end_row) == 2:  # only on two square pawn advances
@@ -83,27 +116,73 @@ class GameState:
             self.en_passant_possible = ()
         # en passant
         if move.is_en_passant:
-            self.board[move.start_row][move.end_col] = 0
+            mailbox[move.start_sq + move.end_col - move.start_col] = 0
 
         # castling
         if move.is_castle_move:
             if move.end_col - move.start_col == 2:  # king moved to kingside
-                self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][move.end_col + 1]  # copy rook
-                self.board[move.end_row][move.end_col + 1] = 0  # erase rook
+                mailbox[move.end_sq - 1] = mailbox[move.end_sq + 1]  # copy rook
+                mailbox[move.end_sq + 1] = 0  # erase rook
             else:  # queenside castle
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 2]  # copy rook
-                self.board[move.end_row][move.end_col - 2] = 0  # erase rook
+                mailbox[move.end_sq + 1] = mailbox[move.end_sq - 2]  # copy rook
+                mailbox[move.end_sq - 2] = 0  # erase rook
 
         # update whenever rook or king moves
         self.update_castle_rights(move)
-        self.castle_rights_log.append((CastleRights(self.castle_rights.wks, self.castle_rights.bks,
-                                               self.castle_rights.wqs, self.castle_rights.bqs)))
 
-        # store board state
-        self.boardstates_log.append(self.get_boardstate())
+        # 50 move rule counter
+        if move.piece_captured != 0 or abs(move.piece_moved) == 1:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
+        # update the zobrist key
+        self.zobrist_key ^= self.get_zobrist_move_key(move) ^ zobrist_black_to_move \
+            ^ zobrist_castling[record[0]] ^ zobrist_castling[self.castle_rights.get_bits()] \
+            ^ get_zobrist_en_passant_key(record[1]) ^ get_zobrist_en_passant_key(self.en_passant_possible)
+        if ZOBRIST_DEBUG:
+            self.check_zobrist_key()
+        self.position_counts[self.zobrist_key] = self.position_counts.get(self.zobrist_key, 0) + 1
+
+        # update material balance, piece counts and the endgame flag from the captured and promoted pieces
+        if move.piece_captured != 0:
+            self.piece_counts[move.piece_captured] -= 1
+            self.material_balance -= piece_material[move.piece_captured]
+            if abs(move.piece_captured) != 1:
+                self.non_pawn_pieces -= 1
+        if move.is_pawn_promotion:
+            self.piece_counts[move.piece_moved] -= 1
+            self.piece_counts[move.promote_to] += 1
+            self.material_balance += piece_material[move.promote_to] - piece_material[move.piece_moved]
+            self.non_pawn_pieces += 1
+        self.endgame = self.non_pawn_pieces <= ENDGAME_PIECES
+
+    def make_null_move(self):
+        # passes the turn, for null move pruning in the search
+        # the move log and the position counts are left alone, a null move isn't a real position of the game
+        self.null_move_log.append((len(self.move_log), self.en_passant_possible, self.zobrist_key))
+        self.zobrist_key ^= zobrist_black_to_move ^ get_zobrist_en_passant_key(self.en_passant_possible)
+        self.en_passant_possible = ()
+        self.white_to_move = not self.white_to_move
+        if ZOBRIST_DEBUG:
+            self.check_zobrist_key()
+
+    def undo_null_move(self):
+        _, self.en_passant_possible, self.zobrist_key = self.null_move_log.pop()
+        self.white_to_move = not self.white_to_move
+        self.checkmate = False
+        self.draw = False
 
-        # update material balance
-        self.material_balance = SmartMoveFinder.score_material(self.board)
+    def undo_to_ply(self, ply):
+        # takes back moves and null moves in the order they were made until the move log is ply moves long,
+        # for a search that was stopped part way
+        while True:
+            if self.null_move_log and self.null_move_log[-1][0] == len(self.move_log) >= ply:
+                self.undo_null_move()
+            elif len(self.move_log) > ply:
+                self.undo_move()
+            else:
+                break
 
     def update_castle_rights(self, move):
         if move.piece_moved == 6:  # king
@@ -140,10 +219,18 @@ class GameState:
 
     def undo_move(self):
         if self.move_log:
+            mailbox = self.mailbox
             move = self.move_log.pop()
-            self.boardstates_log.pop()
-            self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
+            # the position being left counts one time less
+            count = self.position_counts[self.zobrist_key] - 1
+            if count:
+                self.position_counts[self.zobrist_key] = count
+            else:
+                del self.position_counts[self.zobrist_key]
+            castle_bits, self.en_passant_possible, piece_captured, self.zobrist_key, self.halfmove_clock = \
+                self.undo_stack[len(self.move_log)]
+            mailbox[move.start_sq] = move.piece_moved
+            mailbox[move.end_sq] = piece_captured
             self.white_to_move = not self.white_to_move
             # update the king location
             if move.piece_moved == 6:  # king
@@ -152,66 +239,55 @@ class GameState:
                 self.black_king = (move.start_row, move.start_col)
             # undo en passant
             if move.is_en_passant:
-                self.board[move.end_row][move.end_col] = 0  # landing square blank
-                self.board[move.start_row][move.end_col] = move.piece_captured
-                self.en_passant_possible = (move.end_row, move.end_col)
-            # undo a 2 square pawn advance
-            if abs(move.piece_moved) == 1 and abs(move.start_row - move.end_row) == 2:
-                self.en_passant_possible = ()
+                mailbox[move.end_sq] = 0  # landing square blank
+                mailbox[move.start_sq + move.end_col - move.start_col] = piece_captured
 
             # castle
             if move.is_castle_move:
                 if move.end_col - move.start_col == 2:  # kingside
-                    self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 1]  # copy rook
-                    self.board[move.end_row][move.end_col - 1] = 0  # erase rook
+                    mailbox[move.end_sq + 1] = mailbox[move.end_sq - 1]  # copy rook
+                    mailbox[move.end_sq - 1] = 0  # erase rook
                 else:
-                    self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]  # copy rook
-                    self.board[move.end_row][move.end_col + 1] = 0  # erase rook
+                    mailbox[move.end_sq - 2] = mailbox[move.end_sq + 1]  # copy rook
+                    mailbox[move.end_sq + 1] = 0  # erase rook
             # undo castle_rights
-            self.castle_rights_log.pop()
-            self.castle_rights = self.castle_rights_log[-1]
+            self.castle_rights.set_bits(castle_bits)
+            if ZOBRIST_DEBUG:
+                self.check_zobrist_key()
+
+            # update material balance, piece counts and the endgame flag
+            if piece_captured != 0:
+                self.piece_counts[piece_captured] += 1
+                self.material_balance += piece_material[piece_captured]
+                if abs(piece_captured) != 1:
+                    self.non_pawn_pieces += 1
+            if move.is_pawn_promotion:
+                self.piece_counts[move.piece_moved] += 1
+                self.piece_counts[move.promote_to] -= 1
+                self.material_balance -= piece_material[move.promote_to] - piece_material[move.piece_moved]
+                self.non_pawn_pieces -= 1
+            self.endgame = self.non_pawn_pieces <= ENDGAME_PIECES
 
         self.checkmate = False
         self.draw = False
 
-        # update material balance
-        self.material_balance = SmartMoveFinder.score_material(self.board)
-
     """
     Listing legal moves
     """
 
     def get_legal_moves(self):  # considering checks (pins)
-        moves = self.get_all_possible_moves()
+        if self.use_bitboards:
+            import Bitboards  # first use builds its tables
+            return Bitboards.get_legal_moves(self)
         self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
-        king_row = self.white_king[0] if self.white_to_move else self.black_king[0]
-        king_col = self.white_king[1] if self.white_to_move else self.black_king[1]
-        if self.in_check:
-            if len(self.checks) == 1:  # only one check, block, capture (practically same as blocking) or move king
-                moves = self.get_all_possible_moves()
-                # to block check, move piece between checker and king
-                check = self.checks[0]
-                check_row = check[0]
-                check_col = check[1]
-                piece_checking = self.board[check_row][check_col]
-                valid_squares = []
-                if abs(piece_checking) == 3:  # knight
-                    valid_squares = [[check_row, check_col]]
-                else:
-                    for i in range(1, 8):
-                        valid_square = [king_row + check[2] * i, king_col + check[3] * i]  # check[2, 3] are the directions
-                        valid_squares.append(valid_square)
-                        if valid_square[0] == check_row and valid_square[1] == check_col:  # reached the piece checking
-                            break
-                # get rid of moves that don't block checks or moves king
-                for i in range(len(moves) - 1, - 1, - 1):  # go backwards through list to not skip any moves
-                    if abs(moves[i].piece_moved) != 6:  # move doesn't move king so has to block or capture
-                        if not [moves[i].end_row, moves[i].end_col] in valid_squares:  # move doesn't block
-                            moves.remove(moves[i])
-            else:  # double check, king has to move
-                self.get_king_moves(king_row, king_col, moves)
-        else:  # not in check so all moves are fine
+        if not self.in_check:  # not in check so all moves are fine
             moves = self.get_all_possible_moves()
+        elif len(self.checks) == 1:  # only one check, block, capture or move king
+            moves = []
+            self.get_evasion_moves(moves)
+        else:  # double check, king has to move
+            moves = []
+            self.get_king_moves(self.get_king_square(), moves)
         if not moves:  # either checkmate or stalemate
             if self.in_check:
                 self.checkmate = True
@@ -222,610 +298,672 @@ class GameState:
             self.draw = False
         return moves
 
+    def has_legal_move(self):
+        # stops at the first legal move, sets in_check, checkmate and draw like get_legal_moves does
+        if self.use_bitboards:
+            return len(self.get_legal_moves()) > 0
+        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        moves = []
+        if self.in_check:
+            if len(self.checks) == 1:
+                self.get_evasion_moves(moves)
+            else:
+                self.get_king_moves(self.get_king_square(), moves)
+        else:
+            mailbox = self.mailbox
+            turn = 1 if self.white_to_move else -1
+            for sq in Mailbox.SQUARES:
+                piece = mailbox[sq] * turn
+                if 0 < piece < 6:  # the king is tried last, its moves need attack tests
+                    self.piece_move_functions[piece](self, sq, moves)
+                    if moves:
+                        break
+            else:
+                self.get_king_moves(self.get_king_square(), moves)
+        self.checkmate = not moves and self.in_check
+        self.draw = not moves and not self.in_check
+        return len(moves) > 0
+
     def get_all_possible_moves(self):  # without considering checks
         moves = []
-        for r in range(8):
-            for c in range(8):
-                turn = 1 if self.white_to_move else -1
-                if self.board[r][c] * turn > 0:  # if the piece times turn is positive, it is that pieces turn
-                    piece = abs(self.board[r][c])
-                    if piece == 1:  # pawn
-                        self.get_pawn_moves(r, c, moves)
-                    elif piece == 2:  # rook
-                        self.get_rook_moves(r, c, moves)
-                    elif piece == 3:  # knight
-                        self.get_knight_moves(r, c, moves)
-                    elif piece == 4:  # bishop
-                        self.get_bishop_moves(r, c, moves)
-                    elif piece == 5:  # queen
-                        self.get_queen_moves(r, c, moves)
-                    elif piece == 6:  # king
-                        self.get_king_moves(r, c, moves)
+        mailbox = self.mailbox
+        turn = 1 if self.white_to_move else -1
+        for sq in Mailbox.SQUARES:
+            piece = mailbox[sq] * turn
+            if piece > 0:  # if the piece times turn is positive, it is that pieces turn
+                if piece == 1:  # pawn
+                    self.get_pawn_moves(sq, moves)
+                elif piece == 2:  # rook
+                    self.get_rook_moves(sq, moves)
+                elif piece == 3:  # knight
+                    self.get_knight_moves(sq, moves)
+                elif piece == 4:  # bishop
+                    self.get_bishop_moves(sq, moves)
+                elif piece == 5:  # queen
+                    self.get_queen_moves(sq, moves)
+                elif piece == 6:  # king
+                    self.get_king_moves(sq, moves)
         return moves
 
+    def get_capture_moves(self):
+        # legal captures and queen promotions for the quiescence search, every legal move when in check
+        if self.use_bitboards:
+            moves = self.get_legal_moves()
+            return moves if self.in_check else \
+                [move for move in moves if move.piece_captured != 0 or abs(move.promote_to) == 5]
+        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        if self.in_check:
+            return self.get_legal_moves()
+        moves = []
+        mailbox = self.mailbox
+        ally = 1 if self.white_to_move else -1
+        pinned = {pin[0]: pin[1] for pin in self.pins}
+        for sq in Mailbox.SQUARES:
+            piece = mailbox[sq] * ally
+            if piece <= 0:
+                continue
+            pin_direction = pinned.get(sq, 0)
+            if piece == 1:
+                self.get_pawn_captures(sq, pin_direction, moves)
+            elif piece == 3:
+                if not pin_direction:  # a pinned knight can't move
+                    for end_sq in Mailbox.KNIGHT_TARGETS[sq]:
+                        if mailbox[end_sq] * ally < 0:
+                            moves.append(get_move(sq, end_sq, mailbox))
+            elif piece == 6:
+                self.get_king_steps(sq, moves, captures_only=True)
+            else:
+                for offset, ray, slider, pawn in Mailbox.RAYS[sq]:
+                    if piece != 5 and piece != slider:
+                        continue
+                    if pin_direction and pin_direction != offset and pin_direction != -offset:
+                        continue  # pinned pieces can only move along the pin
+                    for end_sq in ray:
+                        if mailbox[end_sq]:
+                            if mailbox[end_sq] * ally < 0:
+                                moves.append(get_move(sq, end_sq, mailbox))
+                            break
+        return moves
+
+    def get_pawn_captures(self, sq, pin_direction, moves):
+        mailbox = self.mailbox
+        ally = 1 if self.white_to_move else -1
+        direction = -10 * ally
+        promotion = Mailbox.ROWS_COLS[sq][0] == (1 if ally == 1 else 6)  # next move lands on the last row
+        if promotion and mailbox[sq + direction] == 0 and (not pin_direction or pin_direction in (10, -10)):
+            moves.append(get_move(sq, sq + direction, mailbox, promote_to=5 * ally))
+        for side in (1, -1):
+            end_sq = sq + direction + side
+            if pin_direction and pin_direction != direction + side and pin_direction != -direction - side:
+                continue
+            if 0 < mailbox[end_sq] * -ally < Mailbox.OFF_BOARD:  # enemy piece
+                if promotion:
+                    for promote_to in (5, 4, 3, 2):
+                        moves.append(get_move(sq, end_sq, mailbox, promote_to=promote_to * ally))
+                else:
+                    moves.append(get_move(sq, end_sq, mailbox))
+            elif self.en_passant_possible and Mailbox.ROWS_COLS[end_sq] == self.en_passant_possible:
+                if self.is_en_passant_legal(sq, end_sq):
+                    moves.append(get_move(sq, end_sq, mailbox, en_passant_possible=True))
+
+    def get_evasion_moves(self, moves):
+        # out of a single check: move the king, capture the checker or block the line between them
+        # works back from the target squares to the pieces that reach them, instead of generating everything
+        mailbox = self.mailbox
+        ally = 1 if self.white_to_move else -1
+        king_sq = self.get_king_square()
+        self.get_king_moves(king_sq, moves)
+        check_sq, check_offset = self.checks[0]
+        pinned = [pin[0] for pin in self.pins]  # a pinned piece can't leave its line, so it can never help
+        direction = -10 * ally  # pawn direction
+        promotion_row = 0 if ally == 1 else 7
+
+        target = check_sq
+        while True:  # the checker first, then the squares back towards the king if it is a slider
+            target_row = Mailbox.ROWS_COLS[target][0]
+            capture = target == check_sq
+            # rooks, bishops and queens
+            for offset, ray, slider, pawn in Mailbox.RAYS[target]:
+                for start_sq in ray:
+                    piece = mailbox[start_sq]
+                    if piece:
+                        if (piece * ally == 5 or piece * ally == slider) and start_sq not in pinned:
+                            moves.append(get_move(start_sq, target, mailbox))
+                        break
+            # knights
+            for start_sq in Mailbox.KNIGHT_TARGETS[target]:
+                if mailbox[start_sq] * ally == 3 and start_sq not in pinned:
+                    moves.append(get_move(start_sq, target, mailbox))
+            # pawns, captures onto the checker or pushes onto an empty square
+            if capture:
+                starts = [start_sq for start_sq in Mailbox.PAWN_ATTACKERS[ally][target] if mailbox[start_sq] == ally]
+            else:
+                starts = []
+                start_sq = target - direction
+                if mailbox[start_sq] == ally:
+                    starts.append(start_sq)
+                elif mailbox[start_sq] == 0 and target_row == (4 if ally == 1 else 3) and \
+                        mailbox[start_sq - direction] == ally:  # 2 square advance
+                    starts.append(start_sq - direction)
+            for start_sq in starts:
+                if start_sq in pinned:
+                    continue
+                if target_row == promotion_row:
+                    for promotion in (5, 4, 3, 2):
+                        moves.append(get_move(start_sq, target, mailbox, promote_to=promotion * ally))
+                else:
+                    moves.append(get_move(start_sq, target, mailbox))
+            if abs(mailbox[check_sq]) in (1, 3):
+                break  # pawns and knights can't be blocked
+            target -= check_offset
+            if target == king_sq:
+                break
+
+        # en passant
+        if self.en_passant_possible:
+            end_sq = Mailbox.get_square(self.en_passant_possible[0], self.en_passant_possible[1])
+            for start_sq in Mailbox.PAWN_ATTACKERS[ally][end_sq]:
+                if mailbox[start_sq] == ally and self.is_en_passant_legal(start_sq, end_sq):
+                    moves.append(get_move(start_sq, end_sq, mailbox, en_passant_possible=True))
+
+    def is_en_passant_legal(self, start_sq, end_sq):
+        # both pawns leave their squares at once, so the capture is tried on the board to see if the king is left attacked
+        mailbox = self.mailbox
+        ally = mailbox[start_sq]
+        captured_sq = end_sq + 10 * ally  # behind the square the pawn lands on
+        mailbox[start_sq] = 0
+        mailbox[captured_sq] = 0
+        mailbox[end_sq] = ally
+        king_safe = not self.get_square_under_attack(self.get_king_square(), ally)
+        mailbox[start_sq] = ally
+        mailbox[captured_sq] = -ally
+        mailbox[end_sq] = 0
+        return king_safe
+
+    def get_king_square(self):
+        king = self.white_king if self.white_to_move else self.black_king
+        return Mailbox.get_square(king[0], king[1])
+
     """
     Legal moves helper functions
     """
 
-    def check_for_pins_and_checks(self):
+    def check_for_pins_and_checks(self, start_sq=None):
+        # pins and checks are (square, direction offset from the king), start_sq tries the king on another square
         pins = []
         checks = []
-        in_check = False
+        mailbox = self.mailbox
         enemy = -1 if self.white_to_move else 1
+        if start_sq is None:
+            start_sq = self.get_king_square()
+        for offset, ray, slider, pawn in Mailbox.RAYS[start_sq]:
+            possible_pin = None
+            for new_sq in ray:
+                end_piece = mailbox[new_sq] * enemy
+                if end_piece == 0 or end_piece == -6:  # empty, or our own king moving away from here
+                    continue
+                if end_piece < 0:  # ally
+                    if possible_pin is None:  # 1st allied piece in that direction
+                        possible_pin = (new_sq, offset)
+                        continue
+                    break  # 2nd allied piece in this direction, so no pin possible
+                # enemy piece, a queen, the slider moving along the ray, or a pawn or king right next to the square
+                if end_piece == 5 or end_piece == slider or \
+                        (new_sq == ray[0] and (end_piece == 6 or (end_piece == 1 and pawn == enemy))):
+                    if possible_pin is None:  # no piece blocking, so check
+                        checks.append((new_sq, offset))
+                    else:  # piece blocking so pin
+                        pins.append(possible_pin)
+                break
+        # knight checks
+        knight = enemy * 3
+        for new_sq in Mailbox.KNIGHT_TARGETS[start_sq]:
+            if mailbox[new_sq] == knight:
+                checks.append((new_sq, new_sq - start_sq))
+        return len(checks) > 0, pins, checks
+
+    def get_check_info(self):
+        # for the side to move: the squares each piece type would check the enemy king from,
+        # and the allied pieces that uncover a check from a slider behind them, with the line they block
+        mailbox = self.mailbox
         ally = 1 if self.white_to_move else -1
-        start_row = self.white_king[0] if self.white_to_move else self.black_king[0]
-        start_col = self.white_king[1] if self.white_to_move else self.black_king[1]
-        card_dir = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for d in range(len(card_dir)):
-            possible_pin = ()  # reset pin
-            for i in range(1, 8):
-                new_row = start_row + card_dir[d][0] * i
-                new_col = start_col + card_dir[d][1] * i
-                if 0 <= new_row < 8 and 0 <= new_col < 8:  # inside board
-                    end_piece = self.board[new_row][new_col]
-                    if end_piece * ally > 0 and abs(end_piece) != 6:  # ally but not king
-                        if possible_pin == ():  # 1st allied piece in that direction
-                            possible_pin = (new_row, new_col, card_dir[d][0], card_dir[d][1])
-                        else:  # 2nd or later allied piece in this direction, so no pin possible
-                            break
-                    elif end_piece * enemy > 0:
-                        piece_type = abs(end_piece)
-                        """
-                        5 possibilities in this complex conditional:
-                        1. Orthogonally away from king and piece is a rook
-                        2. Diagonally away from king and piece is a bishop
-                        3. 1 square away diagonally and piece is a pawn
-                        4. any direction and piece is a queen
-                        5. any direction 1 square away and piece is king
-                        """
-                        if (d < 4 and piece_type == 2) or \
-                                (7 >= d >= 4 == piece_type) or \
-                                (i == 1 and piece_type == 1 and ((enemy == 1 and 6 <= d <= 7) or (enemy == -1 and 4 <= d <= 5))) or \
-                                (piece_type == 5) or (i == 1 and piece_type == 6):
-                            if possible_pin == ():  # no piece blocking, so check
-                                in_check = True
-                                checks.append((new_row, new_col, card_dir[d][0], card_dir[d][1]))
-                                break
-                            else:  # piece blocking so pin
-                                pins.append(possible_pin)
-                                break
-                        else:  # enemy piece not applying check
-                            break
-                else:  # off board
+        king = self.black_king if self.white_to_move else self.white_king
+        king_sq = Mailbox.get_square(king[0], king[1])
+        check_squares = {1: Mailbox.PAWN_ATTACKERS[ally][king_sq], 2: set(), 3: Mailbox.KNIGHT_TARGETS[king_sq],
+                         4: set(), 5: set(), 6: ()}
+        discoverers = {}
+        for offset, ray, slider, pawn in Mailbox.RAYS[king_sq]:
+            blocker = None
+            for new_sq in ray:
+                piece = mailbox[new_sq] * ally
+                if blocker is None:
+                    check_squares[slider].add(new_sq)
+                    check_squares[5].add(new_sq)
+                if not piece:
+                    continue
+                if blocker is None and piece > 0:  # 1st piece on the line is ours, it can uncover a check
+                    blocker = new_sq
+                    continue
+                if blocker is not None and (piece == 5 or piece == slider):
+                    discoverers[blocker] = ray
+                break
+        return check_squares, discoverers
+
+    def gives_check(self, move, check_info):
+        # True if the move checks the enemy king, from get_check_info without making the move
+        if move.is_pawn_promotion or move.is_en_passant or move.is_castle_move:
+            return self.get_special_move_check(move)
+        check_squares, discoverers = check_info
+        if move.end_sq in check_squares[abs(move.piece_moved)]:
+            return True
+        ray = discoverers.get(move.start_sq)
+        return ray is not None and move.end_sq not in ray  # leaves the line it was blocking
+
+    def get_special_move_check(self, move):
+        # promotions, en passant and castling change more squares than the tables cover,
+        # so the squares are set on the mailbox for the attack test and put back
+        mailbox = self.mailbox
+        ally = 1 if self.white_to_move else -1
+        changes = [(move.start_sq, 0), (move.end_sq, move.promote_to or move.piece_moved)]
+        if move.is_en_passant:
+            changes.append((Mailbox.get_square(move.start_row, move.end_col), 0))
+        elif move.is_castle_move:
+            if move.end_col == 6:  # kingside
+                changes += [(move.end_sq + 1, 0), (move.end_sq - 1, ally * 2)]
+            else:
+                changes += [(move.end_sq - 2, 0), (move.end_sq + 1, ally * 2)]
+        saved = [(sq, mailbox[sq]) for sq, _ in changes]
+        for sq, piece in changes:
+            mailbox[sq] = piece
+        king = self.black_king if self.white_to_move else self.white_king
+        check = self.get_square_under_attack(Mailbox.get_square(king[0], king[1]), -ally)
+        for sq, piece in reversed(saved):
+            mailbox[sq] = piece
+        return check
+
+    def get_static_exchange(self, move):
+        # material the capture wins once both sides have captured back on the square as long as it pays,
+        # cheapest piece first, worked out from the attack rays without making moves, pins are ignored
+        sq = move.end_sq
+        mailbox = self.mailbox
+        gains = [exchange_values[abs(move.piece_captured)] if move.piece_captured else 0]
+        piece_value = exchange_values[abs(move.piece_moved)]
+        if move.is_pawn_promotion:
+            piece_value = exchange_values[abs(move.promote_to)]
+            gains[0] += piece_value - 1
+        removed = {move.start_sq}  # pieces that have captured on the square, they no longer block the rays
+        color = -1 if move.piece_moved > 0 else 1
+        while True:
+            attacker_sq = self.get_least_valuable_attacker(sq, color, removed)
+            if attacker_sq is None:
+                break
+            gains.append(piece_value - gains[-1])  # if the side that just captured stops there
+            piece_value = exchange_values[abs(mailbox[attacker_sq])]
+            removed.add(attacker_sq)
+            color = -color
+        # back from the end, either side can stop capturing when going on loses more
+        while len(gains) > 1:
+            gain = gains.pop()
+            gains[-1] = -max(-gains[-1], gain)
+        return gains[0]
+
+    def get_least_valuable_attacker(self, sq, color, removed):
+        # square of color's cheapest piece attacking sq, looking through the removed squares, None if there isn't one
+        mailbox = self.mailbox
+        for new_sq in Mailbox.PAWN_ATTACKERS[color][sq]:
+            if mailbox[new_sq] == color and new_sq not in removed:
+                return new_sq
+        knight = color * 3
+        for new_sq in Mailbox.KNIGHT_TARGETS[sq]:
+            if mailbox[new_sq] == knight and new_sq not in removed:
+                return new_sq
+        queen = color * 5
+        best_sq = None
+        best_value = 100
+        for offset, ray, slider, pawn in Mailbox.RAYS[sq]:
+            for new_sq in ray:
+                piece = mailbox[new_sq]
+                if piece and new_sq not in removed:
+                    if (piece == color * slider or piece == queen) and exchange_values[abs(piece)] < best_value:
+                        best_sq = new_sq
+                        best_value = exchange_values[abs(piece)]
                     break
-        # knight checks:
-        knight_moves = [[2, 1], [2, -1], [-2, 1], [-2, -1], [1, 2], [-1, 2], [1, -2], [-1, -2]]
-        for n in knight_moves:
-            new_row = start_row + n[0]
-            new_col = start_col + n[1]
-            if 0 <= new_row < 8 and 0 <= new_col < 8:  # inside board
-                end_piece = self.board[new_row][new_col]
-                if end_piece * enemy > 0 and abs(end_piece) == 3:  # enemy knight attacking king
-                    in_check = True
-                    checks.append((new_row, new_col, n[0], n[1]))
-        return in_check, pins, checks
-
-    def get_square_under_attack(self, r, c, ally):
+        if best_sq is not None:
+            return best_sq
+        king = color * 6
+        for new_sq in Mailbox.KING_TARGETS[sq]:
+            if mailbox[new_sq] == king and new_sq not in removed:
+                return new_sq
+        return None
+
+    def get_square_under_attack(self, sq, ally):
         # check if an enemy piece is attacking that square, return True if it is => castling illegal
-        # 1. go orthogonally outward from that square and check for rooks and queens
-        # 2. Go diagonally outward and check for bishops, queens or pawn one square away
-        # 3. Check if a king is one square away
-        # 4. check for knights
-        enemy = -1 if ally == 1 else 1
-        # rooks and queen
-        directions = [[1, 0], [-1, 0], [0, 1], [0, -1]]
-        for d in directions:
-            for i in range(8):
-                new_r = r + d[0] * i
-                new_c = c + d[1] * i
-                if 0 <= new_r < 8 and 0 <= new_c < 8:  # inside board
-                    if self.board[new_r][new_c] * ally > 0:  # piece blocking attack
-                        break
-                    if self.board[new_r][new_c] * enemy < 0:
-                        if abs(self.board[new_r][new_c]) == 2 or abs(self.board[new_r][new_c]) == 5:
-                            return True
-                else:  # outside board
+        # walks the precomputed rays out to the first piece, then the pawn, knight and king squares next to it
+        mailbox = self.mailbox
+        enemy = -ally
+        queen = enemy * 5
+        for offset, ray, slider, pawn in Mailbox.RAYS[sq]:
+            for new_sq in ray:
+                piece = mailbox[new_sq]
+                if piece:
+                    if piece == queen or piece == enemy * slider:
+                        return True
                     break
-        # bishops and queen, pawn
-        directions = [[1, 1], [-1, 1], [-1, -1], [1, -1]]
-        for d in directions:
-            for i in range(1, 8):
-                new_r = r + d[0] * i
-                new_c = c + d[1] * i
-                if 0 <= new_r < 8 and 0 <= new_c < 8:  # inside board
-                    if self.board[new_r][new_c] * ally > 0:  # piece blocking attack
-                        break
-                    if self.board[new_r][new_c] * enemy > 0:
-                        if abs(self.board[new_r][new_c]) == 4 or abs(self.board[new_r][new_c]) == 6:
-                            return True
-                        if abs(self.board[new_r][new_c]) == 1 and i == 1:
-                            return True
-                else:  # outside board
-                    break
-        # king
-        directions = [[1, 1], [-1, 1], [-1, -1], [1, -1], [1, 0], [-1, 0], [0, 1], [0, -1]]
-        for d in directions:
-            new_r = r + d[0]
-            new_c = c + d[1]
-            if 0 <= new_r < 8 and 0 <= new_c < 8:  # inside board
-                if self.board[new_r][new_c] == enemy * 6:
-                    return True
-        # knights
-        directions = [[2, 1], [2, -1], [-2, 1], [-2, -1], [1, 2], [-1, 2], [1, -2], [-1, -2]]
-        for d in directions:
-            new_r = r + d[0]
-            new_c = c + d[1]
-            if 0 <= new_r < 8 and 0 <= new_c < 8:  # inside board
-                if self.board[new_r][new_c] == enemy * 3:
-                    return True
+        for new_sq in Mailbox.PAWN_ATTACKERS[enemy][sq]:
+            if mailbox[new_sq] == enemy:
+                return True
+        knight = enemy * 3
+        for new_sq in Mailbox.KNIGHT_TARGETS[sq]:
+            if mailbox[new_sq] == knight:
+                return True
+        king = enemy * 6
+        for new_sq in Mailbox.KING_TARGETS[sq]:
+            if mailbox[new_sq] == king:
+                return True
         return False
 
     """
     Different piece moves
     """
 
-    def get_pawn_moves(self, r, c, moves):
+    def get_pawn_moves(self, sq, moves):
         # pins and stuff
         piece_pinned = False
-        pin_direction = ()
+        pin_direction = 0
         for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
+            if self.pins[i][0] == sq:
                 piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
+                pin_direction = self.pins[i][1]
                 self.pins.remove(self.pins[i])
                 break
 
+        mailbox = self.mailbox
+        r, c = Mailbox.ROWS_COLS[sq]
         direction = -1 if self.white_to_move else 1  # sets pawn direction
         origin_row = 1 if not self.white_to_move else 6
         enemy = -1 if self.white_to_move else 1
         ally = 1 if self.white_to_move else -1
         promotions = [5, 4, 3, 2]
-        if self.board[r + direction][c] == 0:  # 1 square pawn advance,
-            if not piece_pinned or pin_direction == (direction, 0):
+        if mailbox[sq + direction * 10] == 0:  # 1 square pawn advance,
+            if not piece_pinned or pin_direction == direction * 10 or pin_direction == -direction * 10:
                 if r + direction == 0 or r + direction == 7:  # promotion
                     for i in promotions:
-                        moves.append(Move((r, c), (r + direction, c), self.board, promote_to=i * ally))  # adding all different promotions for engine to calculate
+                        moves.append(get_move(sq, sq + direction * 10, mailbox, promote_to=i * ally))  # adding all different promotions for engine to calculate
                 else:
-                    moves.append(Move((r, c), (r + direction, c), self.board))
-                if r == origin_row and self.board[r + 2 * direction][c] == 0:  # 2 square advance
-                    moves.append(Move((r, c), (r + 2 * direction, c), self.board))
-        capture_directions = [[direction, 1], [direction, -1]]
-        for d in capture_directions:
-            new_c = c + d[1]
-            if 0 <= new_c < 8:  # inside board
-                if self.board[r + d[0]][new_c] * enemy > 0:
-                    if not piece_pinned or pin_direction == (d[0], d[1]):
-                        if r + d[0] == 0 or r + d[0] == 7:  # capture and promotion
-                            for i in promotions:
-                                moves.append(Move((r, c), (r + d[0], new_c), self.board, promote_to=i * ally))  # adding all different promotions for engine to calculate
-                        else:  # normal capture
-                            moves.append(Move((r, c), (r + d[0], new_c), self.board))
-                elif (r + d[0], new_c) == self.en_passant_possible:
-                    # check if the same king is on same rank as pawn initially
-                    king_row, king_col = self.white_king if self.white_to_move else self.black_king
-                    attacking_piece = blocking_piece = False
-                    if king_row == r:
-                        if king_col < c:  # king is left of pawn
-                            inside_range = range(king_col + 1, c - 1) if capture_directions.index(d) == 1 else range(king_col + 1, c)
-                            outside_range = range(c + 1, 8) if capture_directions.index(d) == 1 else range(c + 2, 8)
-                        else:  # king right of pawn
-                            inside_range = range(king_col - 1, c, - 1) if capture_directions.index(d) == 1 else range(king_col - 1, c + 1, -1)
-                            outside_range = range(c - 2, -1, -1) if capture_directions.index(d) == 1 else range(c - 1, -1, -1)
-                        for i in inside_range:
-                            if self.board[r][i] != 0:  # some other piece blocks
-                                blocking_piece = True
-                        for j in outside_range:
-                            square = self.board[r][j]
-                            if square * enemy < 0 and (abs(square) == 2 or abs(square) == 5):  # attacking piece
-                                attacking_piece = True
-                            elif square != 0:  # not empty but not enemy rook or queen
-                                blocking_piece = True
-                    if not attacking_piece or blocking_piece:
-                        moves.append(Move((r, c), (r + d[0], new_c), self.board, en_passant_possible=True))
-
-    def get_rook_moves(self, r, c, moves):
-        # pins and stuff
-        piece_pinned = False
-        pin_direction = []
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = [self.pins[i][2], self.pins[i][3]]
-                self.pins.remove(self.pins[i])
-                break
-
-        enemy = -1 if self.white_to_move else 1
-        directions = [[1, 0], [-1, 0], [0, 1], [0, -1]]
-        for d in directions:
-            for i in range(1, 8):
-                new_r = r + d[0] * i
-                new_c = c + d[1] * i
-                if 0 <= new_r < 8 and 0 <= new_c < 8:  # new square is inside board
-                    if self.board[new_r][new_c] == 0:
-                        if not piece_pinned or pin_direction == d:
-                            moves.append(Move((r, c), (new_r, new_c), self.board))
-                    elif self.board[new_r][new_c] * enemy > 0:
-                        if not piece_pinned or pin_direction == d:
-                            moves.append(Move((r, c), (new_r, new_c), self.board))
-                        break
-                    else:
-                        break
-
-    def get_bishop_moves(self, r, c, moves):
-        # pins and stuff
-        piece_pinned = False
-        pin_direction = []
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = [self.pins[i][2], self.pins[i][3]]
-                self.pins.remove(self.pins[i])
-                break
-
-        enemy = -1 if self.white_to_move else 1
-        directions = [[1, 1], [1, -1], [-1, 1], [-1, -1]]
-        for d in directions:
-            for i in range(1, 8):
-                new_r = r + d[0] * i
-                new_c = c + d[1] * i
-                if 0 <= new_r < 8 and 0 <= new_c < 8:  # new square is inside board
-                    if self.board[new_r][new_c] == 0:
-                        if not piece_pinned or pin_direction == d:
-                            moves.append(Move((r, c), (new_r, new_c), self.board))
-                    elif self.board[new_r][new_c] * enemy > 0:
-                        if not piece_pinned or pin_direction == d:
-                            moves.append(Move((r, c), (new_r, new_c), self.board))
-                        break
-                    else:
-                        break
-
-    def get_knight_moves(self, r, c, moves):
+                    moves.append(get_move(sq, sq + direction * 10, mailbox))
+                if r == origin_row and mailbox[sq + direction * 20] == 0:  # 2 square advance
+                    moves.append(get_move(sq, sq + direction * 20, mailbox))
+        for d in (1, -1):
+            end_sq = sq + direction * 10 + d
+            end_piece = mailbox[end_sq]
+            if end_piece == Mailbox.OFF_BOARD:
+                continue
+            if end_piece * enemy > 0:
+                if not piece_pinned or pin_direction == direction * 10 + d:
+                    if r + direction == 0 or r + direction == 7:  # capture and promotion
+                        for i in promotions:
+                            moves.append(get_move(sq, end_sq, mailbox, promote_to=i * ally))  # adding all different promotions for engine to calculate
+                    else:  # normal capture
+                        moves.append(get_move(sq, end_sq, mailbox))
+            elif (r + direction, c + d) == self.en_passant_possible and self.is_en_passant_legal(sq, end_sq):
+                moves.append(get_move(sq, end_sq, mailbox, en_passant_possible=True))
+
+    def get_rook_moves(self, sq, moves):
+        self.get_sliding_moves(sq, Mailbox.ROOK_OFFSETS, moves)
+
+    def get_bishop_moves(self, sq, moves):
+        self.get_sliding_moves(sq, Mailbox.BISHOP_OFFSETS, moves)
+
+    def get_queen_moves(self, sq, moves):
+        self.get_sliding_moves(sq, Mailbox.QUEEN_OFFSETS, moves)
+
+    def get_sliding_moves(self, sq, directions, moves):
         # pins and stuff
         piece_pinned = False
+        pin_direction = 0
         for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
+            if self.pins[i][0] == sq:
                 piece_pinned = True
+                pin_direction = self.pins[i][1]
                 self.pins.remove(self.pins[i])
                 break
 
+        mailbox = self.mailbox
         enemy = -1 if self.white_to_move else 1
-        directions = [[2, 1], [2, -1], [-2, 1], [-2, -1], [1, 2], [-1, 2], [1, -2], [-1, -2]]
         for d in directions:
-            new_r = r + d[0]
-            new_c = c + d[1]
-            if 0 <= new_r < 8 and 0 <= new_c < 8:  # new square is inside board
-                if not piece_pinned:
-                    if self.board[new_r][new_c] == 0:
-                        moves.append(Move((r, c), (new_r, new_c), self.board))
-                    elif self.board[new_r][new_c] * enemy > 0:
-                        moves.append(Move((r, c), (new_r, new_c), self.board))
-
-    def get_queen_moves(self, r, c, moves):
+            if piece_pinned and pin_direction != d and pin_direction != -d:
+                continue  # pinned pieces can only move along the pin
+            end_sq = sq + d
+            while mailbox[end_sq] == 0:
+                moves.append(get_move(sq, end_sq, mailbox))
+                end_sq += d
+            if 0 < mailbox[end_sq] * enemy < Mailbox.OFF_BOARD:  # enemy piece, capture it
+                moves.append(get_move(sq, end_sq, mailbox))
+
+    def get_knight_moves(self, sq, moves):
         # pins and stuff
-        piece_pinned = False
-        pin_direction = []
         for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = [self.pins[i][2], self.pins[i][3]]
+            if self.pins[i][0] == sq:
                 self.pins.remove(self.pins[i])
-                break
+                return  # a pinned knight can't move
 
+        mailbox = self.mailbox
         enemy = -1 if self.white_to_move else 1
-        directions = [[1, 1], [1, -1], [-1, 1], [-1, -1], [1, 0], [-1, 0], [0, 1], [0, -1]]
-        for d in directions:
-            for i in range(1, 8):
-                new_r = r + d[0] * i
-                new_c = c + d[1] * i
-                if 0 <= new_r < 8 and 0 <= new_c < 8:  # new square is inside board
-                    if self.board[new_r][new_c] == 0:
-                        if not piece_pinned or pin_direction == d:
-                            moves.append(Move((r, c), (new_r, new_c), self.board))
-                    elif self.board[new_r][new_c] * enemy > 0:
-                        if not piece_pinned or pin_direction == d:
-                            moves.append(Move((r, c), (new_r, new_c), self.board))
-                        break
-                    else:
-                        break
-
-    def get_king_moves(self, r, c, moves):
-        row_moves = [-1, -1, -1, 0, 0, 1, 1, 1]
-        col_moves = [-1, 0, 1, -1, 1, -1, 0, 1]
+        for d in Mailbox.KNIGHT_OFFSETS:
+            end_piece = mailbox[sq + d]
+            if end_piece == 0 or 0 < end_piece * enemy < Mailbox.OFF_BOARD:  # empty or enemy piece
+                moves.append(get_move(sq, sq + d, mailbox))
+
+    def get_king_moves(self, sq, moves):
+        self.get_king_steps(sq, moves)
+        self.get_castle_moves(sq, moves, 1 if self.white_to_move else -1)
+
+    def get_king_steps(self, sq, moves, captures_only=False):
+        # the one square king moves that don't walk into an attack, only the captures for the quiescence search
+        mailbox = self.mailbox
         ally = 1 if self.white_to_move else -1
-        for i in range(8):
-            new_r = r + row_moves[i]
-            new_c = c + col_moves[i]
-            if 0 <= new_r < 8 and 0 <= new_c < 8:  # new square is inside board
-                end_piece = self.board[new_r][new_c]
-                if end_piece * ally <= 0:  # not an ally piece, empty or enemy
-                    if ally == 1:
-                        self.white_king = (new_r, new_c)
-                    else:
-                        self.black_king = (new_r, new_c)
-                    in_check, pins, checks = self.check_for_pins_and_checks()
-                    if not in_check:
-                        moves.append(Move((r, c), (new_r, new_c), self.board))
-                    # place king back
-                    if ally == 1:
-                        self.white_king = (r, c)
-                    else:
-                        self.black_king = (r, c)
-
-        self.get_castle_moves(r, c, moves, ally)
-
-    def get_castle_moves(self, r, c, moves, ally):
+        king = mailbox[sq]
+        for end_sq in Mailbox.KING_TARGETS[sq]:
+            target = mailbox[end_sq] * ally
+            if target < 0 or (target == 0 and not captures_only):  # enemy, or empty
+                mailbox[sq] = 0  # lift the king, so it can't hide behind itself on a checking ray
+                safe = not self.get_square_under_attack(end_sq, ally)
+                mailbox[sq] = king
+                if safe:
+                    moves.append(get_move(sq, end_sq, mailbox))
+
+    def get_castle_moves(self, sq, moves, ally):
         if self.in_check:
             return  # can't castle while in check
         if (self.white_to_move and self.castle_rights.wks) or (not self.white_to_move and self.castle_rights.bks):
-            self.get_kingside_castle_moves(r, c, moves, ally)
+            self.get_kingside_castle_moves(sq, moves, ally)
         if (self.white_to_move and self.castle_rights.wqs) or (not self.white_to_move and self.castle_rights.bqs):
-            self.get_queenside_castle_moves(r, c, moves, ally)
+            self.get_queenside_castle_moves(sq, moves, ally)
 
-    def get_kingside_castle_moves(self, r, c, moves, ally):
-        if self.board[r][c + 1] == 0 and self.board[r][c + 2] == 0:  # empty squares between rook and king
-            if not self.get_square_under_attack(r, c + 1, ally) and not self.get_square_under_attack(r, c + 2, ally):
-                moves.append(Move((r, c), (r, c + 2), self.board, is_castle_move=True))
+    def get_kingside_castle_moves(self, sq, moves, ally):
+        if self.mailbox[sq + 1] == 0 and self.mailbox[sq + 2] == 0:  # empty squares between rook and king
+            if not self.get_square_under_attack(sq + 1, ally) and not self.get_square_under_attack(sq + 2, ally):
+                moves.append(get_move(sq, sq + 2, self.mailbox, is_castle_move=True))
 
-    def get_queenside_castle_moves(self, r, c, moves, ally):
-        if self.board[r][c - 1] == 0 and self.board[r][c - 2] == 0 and self.board[r][c - 3] == 0:  # empty squares between rook and king
-            # TODO: check if square under attack
-            if not self.get_square_under_attack(r, c - 1, ally) and not self.get_square_under_attack(r, c - 2, ally):
-                moves.append(Move((r, c), (r, c - 2), self.board, is_castle_move=True))
+    def get_queenside_castle_moves(self, sq, moves, ally):
+        if self.mailbox[sq - 1] == 0 and self.mailbox[sq - 2] == 0 and self.mailbox[sq - 3] == 0:  # empty squares between rook and king
+            if not self.get_square_under_attack(sq - 1, ally) and not self.get_square_under_attack(sq - 2, ally):
+                moves.append(get_move(sq, sq - 2, self.mailbox, is_castle_move=True))
 
     # draw logic
     def get_draw(self):
-        # TODO: make get draw function more accurate
-        piece_found = False
-        for row in range(8):
-            if not piece_found:
-                for col in range(8):
-                    # check if only kings are on board
-                    if 0 < abs(self.board[row][col]) < 6:
-                        piece_found = True
-                        break
-        if not piece_found:
-            self.draw = True
+        if not self.has_legal_move():  # checkmate or stalemate, has_legal_move sets the flags
             return
-        # threefold repetition
-        # check if the same boardstate occurs three times
-        repetitions = 0
-        if len(self.boardstates_log) >= 9:
-            checking_state = self.boardstates_log[-1]
-            for i in range(-5, -10, -4):
-                if self.boardstates_log[i] == checking_state:
-                    repetitions += 1
-            if repetitions == 2:
-                self.draw = True
-                return
-        # 50 move rule, go backwards in movelog, if no captures in 50 moves or pawn pushes => draw
-        if len(self.move_log) >= 100:
-            for i in range(-1, -100, -1):
-                move = self.move_log[i]
-                if move.piece_captured != 0 or abs(move.piece_moved) == 1:
-                    return
+        if self.get_draw_by_rule():
             self.draw = True
-            return
+
+    def get_draw_by_rule(self):
+        # threefold repetition, the 50 move rule or insufficient material, O(1) so the search can call it too
+        return self.position_counts[self.zobrist_key] >= 3 or self.halfmove_clock >= 100 or \
+            self.get_insufficient_material()
+
+    def get_insufficient_material(self):
+        # bare kings, or a lone bishop or knight against a bare king
+        if self.non_pawn_pieces > 3 or self.piece_counts[1] or self.piece_counts[-1]:
+            return False
+        counts = self.piece_counts
+        return self.non_pawn_pieces == 2 or counts[3] + counts[-3] + counts[4] + counts[-4] == 1
 
     def get_opening(self):
-        next_move = None
-        if len(self.move_log) > 1:
-            candidate_moves = []
-            moves_so_far = []
-            for move in self.move_log:
-                moves_so_far.append(move.get_notation())
-
-            ruy_lopez = {'e4': 'e5',
-                         'e5': 'Nf3',
-                         'Nf3': 'Nc6',
-                         'Nc6': 'Bb5',
-                         'Bb5': ('a6', 'Nf6')}
-            french_defence = {'e4': 'e6',
-                              'e6': 'd4',
-                              'd4': 'd5',
-                              'd5': ('Nc3', 'Nd2', 'e5', 'exd5')}
-            caro_kann = {'e4': 'c6',
-                         'c6': 'd4',
-                         'd4': 'd5',
-                         'd5': ('Nc3', 'Nd2', 'e5', 'exd5')}
-            kings_gambit = {'e4': 'e5',
-                            'e5': 'f4',
-                            'f4': 'exf4',
-                            'exf4': 'Nf3',
-                            'Nf3': ('g5', 'd5', 'd6')}
-            reti_main =     {'Nf3': 'Nf6',
-                            'Nf6': 'g3',
-                            'g3': ('g6', 'd5')}
-            reti_side = {'Nf6': 'd5',
-                         'd5': ('d4', 'g3', 'c4', 'b3', 'e3')}
-            queens_gambit = {'d4': 'd5',
-                             'd5': 'c4',
-                             'c4': ('c6', 'e6', 'dxc4')}
-            english = {'c4': 'c5',
-                       'c5': 'Nf3',
-                       'Nf3': 'Nf6',
-                       'Nf6': 'Nc3',
-                       'Nc3': ('g3', 'd4', 'e3')}
-            kings_english = {'c4': 'e5',
-                             'e5': ('Nc3', 'g3', 'e3')}
-            modern_defence = {'e4': 'g6',
-                              'g6': 'd4',
-                              'd4': 'Bg7',
-                              'Bg7': ('Nc3', 'Nf6', 'c4')}
-            dutch = {'d4': 'f5',
-                     'f5': 'g3',
-                     'g3': 'Nf6',
-                     'Nf6': 'Bg2',
-                     'Bg2': 'g6',
-                     'g6': ('Nf3', 'c3', 'c4', 'Nd2')}
-            dragon =    {'e4': 'c5',
-                        'c5': 'Nf3',
-                        'Nf3': 'g6',
-                        'g6': 'd4',
-                        'd4': 'cxd4',
-                        'cxd4': 'Nxd4',
-                        'Nxd4': 'Nc6',
-                        'Nc6': ('Nc3', 'c4')}
-            open_sicilian = {'e4': 'c5',
-                            'c5': 'Nf3',
-                            'Nf3': 'Nc6',
-                            'Nc6': 'd4',
-                            'd4': 'cxd4',
-                            'cxd4': 'Nxd4',
-                            'Nxd4': ('Nf6', 'e6', 'g6', 'e5', 'Qb6', 'Qc7')}
-            najdorf =   {'e4': 'c5',
-                        'c5': 'Nf3',
-                        'Nf3': 'd6',
-                         'd6': 'd4',
-                         'd4': 'cxd4',
-                         'cxd4': 'Nxd4',
-                         'Nxd4': 'Nf6',
-                         'Nf6': 'Nc3',
-                         'Nc3': 'a6',
-                         'a6': ('Bg5', 'Be3', 'Be2', 'Bc4', 'h3', 'h4', 'g3', 'f3', 'a4')}
-            scandinavian = {'e4': 'd5',
-                            'd5': 'exd5',
-                            'exd5': 'Qxd5',
-                            'Qxd5': 'Nc3',
-                            'Nc3': 'Qa5',
-                            'Qa5': ('d4', 'Bc4', 'Nf3', 'g3')}
-            kings_pawn = {'e4': 'e5',
-                          'e5': ('Nf3', 'd4', 'Nc3')}
-            agincourt = {'c4': 'e6',
-                         'e6': 'd4',
-                         'd4': 'Nf6',
-                         'Nf6': ('Nf3', 'Nc3', 'g3')}
-            old_benoni = {'d4': 'c5',
-                          'c5': 'd5',
-                          'd5': ('e5', 'Nf6', 'd6', 'g6')}
-            kings_knight_english = {'c4': 'Nf6',
-                                    'Nf6': 'Nf3',
-                                    'Nf3': ('g6', 'e6', 'c5', 'c6', 'b6', 'd6')}
-            pirc = {'e4': 'd6',
-                    'd6': 'd4',
-                    'd4': 'Nf6',
-                    'Nf6': 'Nc3',
-                    'Nc3': 'g6',
-                    'g6': ('f4', 'Nf3', 'Be3', 'Bg5', 'g3')}
-            nimzo_larsen = {'Nf3': 'Nf6',
-                            'Nf6': 'b3',
-                            'b3': ('d5', 'g6', 'c5')}
-            tartakower = {'d4': 'd6',
-                          'd6': 'Nf3',
-                          'Nf3': 'Nf6',
-                          'Nf6': 'c4',
-                          'c4': 'g6',
-                          'g6': 'Nc3',
-                          'Nc3': 'Bg7',
-                          'Bg7': 'e4',
-                          'e4': '0-0',
-                          '0-0': ('Be2', 'h3', 'Be3')}
-            zukertort = {'Nf3': 'd5',
-                         'd5': 'd4',
-                         'd4': 'Nf6',
-                         'Nf6': 'c4',
-                         'c4': ('c6', 'e6', 'dxc4', 'g6')}
-
-            openings = [kings_pawn, ruy_lopez, french_defence, caro_kann, kings_gambit, reti_main, queens_gambit, english,
-                        modern_defence, dutch, dragon, scandinavian, reti_side, kings_english, agincourt, old_benoni,
-                        kings_knight_english, pirc, open_sicilian, najdorf, nimzo_larsen, tartakower, zukertort]
-            openings_to_opening = [(kings_pawn, "King's Pawn Opening"), (ruy_lopez, 'Ruy Lopez Opening'),
-                                   (french_defence, "French Defence"), (caro_kann, "Caro-Kann Defence"),
-                                   (kings_gambit,"King's Gambit"), (reti_main, "Réti Opening: King's Indian Attack"),
-                                   (reti_side, "Réti Opening"), (queens_gambit, "Queen's Gambit"),
-                                   (english, "English Opening: Symmetrical"),
-                                   (kings_english, "English Opening: King's English"),
-                                   (modern_defence, "Modern Defence"), (dutch, "Dutch Defence"),
-                                   (dragon, "Sicilian Defence: Accelerated Dragon"), (scandinavian, "Scandinavian Defence"),
-                                   (agincourt, "Indian Game: East Indian Defence"), (old_benoni, "Old Benoni Defence"),
-                                   (kings_knight_english, "English Opening, King's Knight"),
-                                   (pirc, "Pirc Defence"), (open_sicilian, "Sicilian Defence: Open"),
-                                   (najdorf, "Sicilian Defence: Najdorf"), (nimzo_larsen, "Réti Opening: Nimzo-Larsen"),
-                                   (tartakower, "King's Indian: Normal"), (zukertort, "Queen's Pawn: Symmetrical")]
-            random.shuffle(openings)
-            for opening in openings:
-                next_move_in_line = self.get_next_opening_line_move(opening, moves_so_far)
-                if next_move_in_line:
-                    if type(next_move_in_line) is tuple:
-                        for move in next_move_in_line:
-                            candidate_moves.append(move)
-                    else:
-                        candidate_moves.append(next_move_in_line)
-                    for name in openings_to_opening:
-                        if name[0] == opening:
-                            self.opening = name[1]
-                            break
-                    break
-            if candidate_moves:
-                next_move = candidate_moves[random.randint(0, len(candidate_moves) - 1)]
-        else:  # first moves for white and black
-            if len(self.move_log) == 1:  # blacks reply
-                first_move = self.move_log[0].get_notation()
-                black_reply = []
-                if first_move == 'Nf3':
-                    self.opening = 'Reti Opening'
-                    black_reply = ['Nf6', 'd5', 'c5', 'g6']
-                elif first_move == 'c4':
-                    self.opening = 'English Opening'
-                    black_reply = ['c5', 'e4', 'Nf6', 'e6']
-                elif first_move == 'd4':
-                    self.opening = "Queen's Pawn Opening"
-                    black_reply = ['Nf6', 'd5', 'e6', 'd6', 'f5', 'g6', 'c5']
-                elif first_move == 'e4':
-                    self.opening = "King's Pawn Opening"
-                    black_reply = ['Nf6', 'd5', 'e6', 'd6', 'g6', 'c5', 'e5', 'c6']
-                elif first_move == 'f4':
-                    self.opening = "Bird's opening"
-                    black_reply = ['d5', 'Nf6', 'e6', 'g6', 'c5']
-                if black_reply:
-                    next_move = black_reply[random.randint(0, len(black_reply) - 1)]
+        # the book move for the position and the opening name, the book is compiled the first time it's asked
+        import OpeningBook
+        next_move, name = OpeningBook.get_book_move(self)
+        if name:
+            self.opening = name
+        print("Next move should be", next_move.get_notation() if next_move else None)
+        self.in_opening = next_move is not None
+        return next_move, self.opening, self.in_opening
+
+    """
+    FEN
+    """
+
+    @classmethod
+    def from_fen(cls, fen, games_won=(0, 0), use_bitboards=False):
+        gamestate = cls(games_won, use_bitboards)
+        gamestate.set_fen(fen)
+        return gamestate
+
+    def set_fen(self, fen):
+        # replaces the position with the FEN one, the move history is lost
+        fields = fen.split()
+        if len(fields) == 4:
+            fields += ['0', '1']  # EPD style, no move counters
+        if len(fields) != 6:
+            raise ValueError("FEN needs 6 fields: " + fen)
+        placement, side, castling, en_passant, halfmove_clock, fullmove_number = fields
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError("FEN needs 8 ranks: " + fen)
+        board = []
+        for rank in ranks:
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row += [0] * int(char)
+                elif char in fen_to_piece:
+                    row.append(fen_to_piece[char])
                 else:
-                    next_move = None
-            else:  # white
-                first_moves = ['c4', 'd4', 'e4', 'Nf3', 'd4', 'e4', 'd4', 'e4']  # biased towards e4, d4
-                next_move = first_moves[random.randint(0, len(first_moves) - 1)]
-        print("Next move should be", next_move)
-        if next_move is None:
-            in_opening = False
-            self.in_opening = False
-        elif next_move:
-            in_opening = True
-            self.in_opening = True
-        return next_move, self.opening, in_opening
-
-    def get_next_opening_line_move(self, opening, moves_so_far):
-        if len(moves_so_far) >= 2:
-            for move in range(0, len(moves_so_far) - 1):
-                if moves_so_far[move] not in opening:
-                    return False
-                if not (opening[moves_so_far[move]] == moves_so_far[move + 1]):  # hashmap
-                    return False
-            # all moves so far are in the opening, return next move
-            return opening[moves_so_far[-1]]
-        else:
-            if moves_so_far[0] in opening:
-                return opening[moves_so_far[0]]
-            return False
+                    raise ValueError("Unknown piece '" + char + "' in FEN: " + fen)
+            if len(row) != 8:
+                raise ValueError("FEN rank '" + rank + "' isn't 8 squares: " + fen)
+            board.append(row)
 
-    def get_boardstate(self):
-        board_string = ''
+        self.mailbox[:] = Mailbox.new_mailbox(board)  # in place, the board view stays on the same list
         for row in range(8):
             for col in range(8):
-                board_string += str(self.board[row][col])
-        board_state = (board_string, self.castle_rights_log[-1].castles_ID, self.en_passant_possible, self.white_to_move)
-        return board_state
+                if board[row][col] == 6:
+                    self.white_king = (row, col)
+                elif board[row][col] == -6:
+                    self.black_king = (row, col)
+        self.white_to_move = side == 'w'
+        self.promote_to = 5 if self.white_to_move else -5
+        self.castle_rights = CastleRights('K' in castling, 'k' in castling, 'Q' in castling, 'q' in castling)
+        if en_passant == '-':
+            self.en_passant_possible = ()
+        else:
+            self.en_passant_possible = (ranks_to_rows[en_passant[1]], files_to_cols[en_passant[0]])
+        self.halfmove_clock = int(halfmove_clock)
+        # plies played before the position, to_fen counts the full moves on from here
+        self.start_ply = (int(fullmove_number) - 1) * 2 + (0 if self.white_to_move else 1)
+        self.move_log = []
+        self.null_move_log = []
+        self.legal_moves = []
+        self.in_opening = placement == START_FEN.split()[0] and self.start_ply == 0
+        self.opening = ''
+        self.checkmate = False
+        self.draw = False
+        self.in_check = False
+        self.count_material()
+        self.zobrist_key = self.compute_zobrist_key()
+        self.position_counts = {self.zobrist_key: 1}
 
-    def evaluate_endgame(self):
-        pieces = 0
+    def to_fen(self):
+        ranks = []
         for row in range(8):
+            rank = ''
+            empty = 0
             for col in range(8):
-                if self.board[row][col] != 0 and abs(self.board[row][col]) != 1:  # don't count pawns
-                    pieces += 1
-        if pieces > 5:
+                piece = self.board[row][col]
+                if piece == 0:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece_to_fen[piece]
+            ranks.append(rank + (str(empty) if empty else ''))
+        castling = ('K' if self.castle_rights.wks else '') + ('Q' if self.castle_rights.wqs else '') + \
+                   ('k' if self.castle_rights.bks else '') + ('q' if self.castle_rights.bqs else '')
+        en_passant = get_rank_file(*self.en_passant_possible) if self.en_passant_possible else '-'
+        fullmove_number = (self.start_ply + len(self.move_log)) // 2 + 1
+        return ' '.join(('/'.join(ranks), 'w' if self.white_to_move else 'b', castling or '-', en_passant,
+                         str(self.halfmove_clock), str(fullmove_number)))
+
+    def compute_zobrist_key(self):
+        # full recompute of the zobrist key, make_move and undo_move update it incrementally
+        key = 0
+        for index, sq in enumerate(Mailbox.SQUARES):
+            if self.mailbox[sq] != 0:
+                key ^= zobrist_pieces[self.mailbox[sq]][index]
+        key ^= zobrist_castling[self.castle_rights.get_bits()]
+        key ^= get_zobrist_en_passant_key(self.en_passant_possible)
+        if not self.white_to_move:
+            key ^= zobrist_black_to_move
+        return key
+
+    def check_zobrist_key(self):
+        if self.zobrist_key != self.compute_zobrist_key():
+            raise RuntimeError("Zobrist key out of sync with the board after " +
+                               ' '.join(move.get_notation() for move in self.move_log))
+
+    @staticmethod
+    def get_zobrist_move_key(move):
+        # the pieces and squares a move changes, the same key makes and unmakes the move
+        start = move.start_row * 8 + move.start_col
+        end = move.end_row * 8 + move.end_col
+        piece_placed = move.promote_to if move.is_pawn_promotion else move.piece_moved
+        key = zobrist_pieces[move.piece_moved][start] ^ zobrist_pieces[piece_placed][end]
+        if move.is_en_passant:
+            key ^= zobrist_pieces[move.piece_captured][move.start_row * 8 + move.end_col]
+        elif move.piece_captured != 0:
+            key ^= zobrist_pieces[move.piece_captured][end]
+        if move.is_castle_move:
+            rook = 2 if move.piece_moved > 0 else -2
+            if move.end_col - move.start_col == 2:  # kingside
+                key ^= zobrist_pieces[rook][move.end_row * 8 + 7] ^ zobrist_pieces[rook][move.end_row * 8 + 5]
+            else:  # queenside
+                key ^= zobrist_pieces[rook][move.end_row * 8] ^ zobrist_pieces[rook][move.end_row * 8 + 3]
+        return key
+
+    def count_material(self):
+        # full count of the material, make_move and undo_move keep it up to date incrementally
+        self.piece_counts = {piece: 0 for piece in piece_material}
+        for sq in Mailbox.SQUARES:
+            if self.mailbox[sq] != 0:
+                self.piece_counts[self.mailbox[sq]] += 1
+        self.material_balance = SmartMoveFinder.score_material(self.mailbox)
+        self.non_pawn_pieces = sum(count for piece, count in self.piece_counts.items() if abs(piece) != 1)
+        self.evaluate_endgame()
+
+    def evaluate_endgame(self):
+        if self.non_pawn_pieces > ENDGAME_PIECES:
             self.endgame = False
         else:
             self.endgame = True
 
 
+# move generator for each piece type, pawn = 1 ... queen = 5
+GameState.piece_move_functions = {1: GameState.get_pawn_moves, 2: GameState.get_rook_moves,
+                                  3: GameState.get_knight_moves, 4: GameState.get_bishop_moves,
+                                  5: GameState.get_queen_moves}
+
+
 class CastleRights:  # for storing the info about castling rights
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks
@@ -833,46 +971,77 @@ class CastleRights:  # for storing the info about castling rights
         self.wqs = wqs
         self.bqs = bqs
 
+    @property
+    def castles_ID(self):
         four = '1' if self.wks else '0'
         three = '1' if self.bks else '0'
         two = '1' if self.wqs else '0'
         one = '1' if self.bqs else '0'
-        self.castles_ID = int(four + three + two + one)
+        return int(four + three + two + one)
 
     def __eq__(self, other):
         if isinstance(other, CastleRights):
             return self.castles_ID == other.castles_ID
         return False
 
+    def get_bits(self):
+        return self.wks | self.bks << 1 | self.wqs << 2 | self.bqs << 3
+
+    def set_bits(self, bits):
+        self.wks = bits & 1 != 0
+        self.bks = bits & 2 != 0
+        self.wqs = bits & 4 != 0
+        self.bqs = bits & 8 != 0
+
 
 ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
 rows_to_ranks = {v: k for k, v in ranks_to_rows.items()}
 
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+piece_to_fen = {piece: name[1].upper() if piece > 0 else name[1] for piece, name in int_to_string.items() if piece}
+fen_to_piece = {v: k for k, v in piece_to_fen.items()}
+
 files_to_cols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
 cols_to_files = {v: k for k, v in files_to_cols.items()}
 
 
 class Move:
+    # moves are packed into one int, the mailbox squares, the pieces (+ 6 so they are positive) and the flags:
+    # start_sq | end_sq << 7 | piece_moved << 14 | piece_captured << 18 | promote_to << 22 | en passant << 26 | castle << 27
+    __slots__ = ('packed', 'start_sq', 'end_sq', 'start_row', 'start_col', 'end_row', 'end_col', 'piece_moved',
+                 'piece_captured', 'promote_to', 'is_pawn_promotion', 'is_en_passant', 'is_castle_move', 'move_ID',
+                 'notation')
+
     def __init__(self, start_sq, end_sq, board, en_passant_possible=False, is_castle_move=False, promote_to=0):
-        self.start_row = start_sq[0]
-        self.start_col = start_sq[1]
-        self.end_row = end_sq[0]
-        self.end_col = end_sq[1]
-        self.board = board
-        self.piece_moved = self.board[self.start_row][self.start_col]
-        self.piece_captured = self.board[self.end_row][self.end_col]
-
-        self.promote_to = promote_to
+        # board is only read for the moved and captured piece, the move doesn't keep it
+        piece_moved = board[start_sq[0]][start_sq[1]]
+        piece_captured = -piece_moved if en_passant_possible else board[end_sq[0]][end_sq[1]]
+        self.unpack(pack_move(Mailbox.get_square(start_sq[0], start_sq[1]), Mailbox.get_square(end_sq[0], end_sq[1]),
+                              piece_moved, piece_captured, promote_to, en_passant_possible, is_castle_move))
+
+    def unpack(self, packed):
+        self.packed = packed
+        self.start_sq = packed & 127  # mailbox squares
+        self.end_sq = packed >> 7 & 127
+        self.start_row, self.start_col = Mailbox.ROWS_COLS[self.start_sq]
+        self.end_row, self.end_col = Mailbox.ROWS_COLS[self.end_sq]
+        self.piece_moved = (packed >> 14 & 15) - 6
+        self.piece_captured = (packed >> 18 & 15) - 6
+
+        self.promote_to = (packed >> 22 & 15) - 6
         self.is_pawn_promotion = False if not self.promote_to else True
 
-        self.is_en_passant = en_passant_possible
-        if self.is_en_passant:
-            self.piece_captured = 1 if self.piece_moved == -1 else 1
+        self.is_en_passant = packed >> 26 & 1 == 1
 
         # castle move
-        self.is_castle_move = is_castle_move
+        self.is_castle_move = packed >> 27 & 1 == 1
 
         self.move_ID = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+        self.notation = None  # filled in by get_notation
+
+    def __reduce__(self):
+        # pickle as the packed int, that's all a search process needs to rebuild the move
+        return get_packed_move, (self.packed,)
 
     """
     Overriding the equals method, to allow python to recognize the tuples as equal and not two different objects
@@ -883,7 +1052,15 @@ class Move:
             return self.move_ID == other.move_ID
         return False
 
+    def __hash__(self):
+        return self.move_ID
+
     def get_notation(self):
+        if self.notation is None:
+            self.notation = self.get_new_notation()
+        return self.notation
+
+    def get_new_notation(self):
         if self.is_castle_move:
             if self.end_col == 6:  # kingside
                 return '0-0'
@@ -897,12 +1074,39 @@ class Move:
         return piece + captures + get_rank_file(self.end_row, self.end_col) + promotion
 
 
-def get_rank_file(r, c):
-    return cols_to_files[c] + rows_to_ranks[r]
+def pack_move(start_sq, end_sq, piece_moved, piece_captured, promote_to=0, is_en_passant=False, is_castle_move=False):
+    return start_sq | end_sq << 7 | (piece_moved + 6) << 14 | (piece_captured + 6) << 18 | (promote_to + 6) << 22 | \
+        is_en_passant << 26 | is_castle_move << 27
+
 
+# every move the generators produce is interned here, so a move is allocated once and its notation worked out once
+interned_moves = {}
 
 
+def get_packed_move(packed):
+    move = interned_moves.get(packed)
+    if move is None:
+        move = Move.__new__(Move)
+        move.unpack(packed)
+        interned_moves[packed] = move
+    return move
 
 
+def get_move(start_sq, end_sq, mailbox, en_passant_possible=False, is_castle_move=False, promote_to=0):
+    # the generators' Move constructor, takes mailbox squares and returns the interned move
+    piece_moved = mailbox[start_sq]
+    piece_captured = -piece_moved if en_passant_possible else mailbox[end_sq]
+    packed = start_sq | end_sq << 7 | (piece_moved + 6) << 14 | (piece_captured + 6) << 18 | (promote_to + 6) << 22 | \
+        en_passant_possible << 26 | is_castle_move << 27
+    move = interned_moves.get(packed)
+    if move is None:
+        move = get_packed_move(packed)
+    return move
+
+
+def get_rank_file(r, c):
+    return cols_to_files[c] + rows_to_ranks[r]
 
 
+def get_zobrist_en_passant_key(en_passant_square):
+    return zobrist_en_passant[en_passant_square[1]] if en_passant_square else 0
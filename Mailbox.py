@@ -0,0 +1,103 @@
+"""
+10x12 mailbox board shared by Engine, SmartMoveFinder and Bitboards
+- the 8x8 board sits inside a border of OFF_BOARD squares, two rows deep above and below so that knight jumps
+  from the edge land on the border too, so stepping off the board is a single comparison
+- a step in any direction is a fixed offset, row * 10 + col
+- BoardView keeps board[row][col] working for the GUI and older code
+"""
+
+OFF_BOARD = 7  # bigger than any piece, so 0 < piece * ally < OFF_BOARD only holds for the ally's pieces
+
+
+def get_square(row, col):
+    return (row + 2) * 10 + col + 1
+
+
+SQUARES = [get_square(row, col) for row in range(8) for col in range(8)]  # row * 8 + col -> mailbox square
+ROWS_COLS = [None] * 120  # mailbox square -> (row, col)
+for index, square in enumerate(SQUARES):
+    ROWS_COLS[square] = divmod(index, 8)
+
+ROOK_OFFSETS = (10, -10, 1, -1)
+BISHOP_OFFSETS = (11, 9, -9, -11)
+QUEEN_OFFSETS = (11, 9, -9, -11, 10, -10, 1, -1)
+KNIGHT_OFFSETS = (21, 19, -19, -21, 12, -8, 8, -12)
+KING_OFFSETS = (-11, -10, -9, -1, 1, 9, 10, 11)
+CHECK_OFFSETS = (-10, -1, 10, 1, -11, -9, 9, 11)  # orthogonal first, then diagonal, the order checks and pins come in
+
+
+def get_ray(square, offset):
+    # the squares from the square to the edge of the board, the square itself not included
+    ray = []
+    square += offset
+    while ROWS_COLS[square] is not None:
+        ray.append(square)
+        square += offset
+    return tuple(ray)
+
+
+def get_targets(square, offsets):
+    return tuple(square + offset for offset in offsets if ROWS_COLS[square + offset] is not None)
+
+
+# attack tables for every mailbox square, None on the border
+# a ray is (offset, squares, slider, pawn): the rook or bishop that moves along it,
+# and the color of a pawn that attacks back along it from the first square, 0 on the orthogonal rays
+RAYS = [None] * 120
+KNIGHT_TARGETS = [None] * 120
+KING_TARGETS = [None] * 120
+PAWN_ATTACKERS = {1: [None] * 120, -1: [None] * 120}  # squares a pawn of that color attacks the square from
+for square in SQUARES:
+    RAYS[square] = tuple((offset, get_ray(square, offset), 2 if offset in ROOK_OFFSETS else 4,
+                          0 if offset in ROOK_OFFSETS else 1 if offset > 0 else -1)
+                         for offset in CHECK_OFFSETS if get_ray(square, offset))
+    KNIGHT_TARGETS[square] = get_targets(square, KNIGHT_OFFSETS)
+    KING_TARGETS[square] = get_targets(square, KING_OFFSETS)
+    PAWN_ATTACKERS[1][square] = get_targets(square, (9, 11))  # white pawns attack upwards, from the row below
+    PAWN_ATTACKERS[-1][square] = get_targets(square, (-11, -9))
+
+
+def new_mailbox(board):
+    mailbox = [OFF_BOARD] * 120
+    for row in range(8):
+        for col in range(8):
+            mailbox[get_square(row, col)] = board[row][col]
+    return mailbox
+
+
+class BoardView:
+    # board[row][col] on top of the mailbox, reads and writes go straight to the mailbox list
+    __slots__ = ('mailbox', 'rows')
+
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+        self.rows = [BoardRow(mailbox, get_square(row, 0)) for row in range(8)]
+
+    def __getitem__(self, row):
+        return self.rows[row]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return 8
+
+
+class BoardRow:
+    __slots__ = ('mailbox', 'start')
+
+    def __init__(self, mailbox, start):
+        self.mailbox = mailbox
+        self.start = start
+
+    def __getitem__(self, col):
+        return self.mailbox[self.start + col]
+
+    def __setitem__(self, col, piece):
+        self.mailbox[self.start + col] = piece
+
+    def __iter__(self):
+        return iter(self.mailbox[self.start:self.start + 8])
+
+    def __len__(self):
+        return 8
@@ -1,13 +1,9 @@
-import pygame as p
-from win32api import GetSystemMetrics
-import Engine, Display, SmartMoveFinder
+import Engine, SmartMoveFinder, TranspositionTable
 from multiprocessing import Process, Queue
 
-WIDTH = GetSystemMetrics(0)
-HEIGHT = GetSystemMetrics(1)
-BOARDGAP = HEIGHT // 10
-SQ_SIZE = (HEIGHT - 2 * BOARDGAP) // 8
 FPS = 30
+THINK_TIME = 5  # seconds the AI gets for a move
+SEARCH_WORKERS = 1  # processes the AI splits its search across, up to the number of cores
 
 
 def main():
@@ -16,8 +12,9 @@ def main():
     screen = p.display.set_mode((WIDTH, HEIGHT))
     p.display.set_caption('Chess2')
     screen.fill(p.Color("Gray"))
-    gamestate = Engine.GameState(WIDTH, HEIGHT, SQ_SIZE, [0, 0])
-    gamestate.get_boardstate()
+    gamestate = Engine.GameState([0, 0])
+    # in shared memory, so every search process of the game starts from what the ones before learned
+    transposition_table = TranspositionTable.TranspositionTable(SmartMoveFinder.TT_MEGABYTES, shared=True)
     clock = p.time.Clock()
     sq_selected = ()
     mouse_clicks = []
@@ -91,7 +88,7 @@ def main():
                                 mouse_clicks = [sq_selected]
                 reset_pos, reset_size = Display.get_reset_button()
                 if reset_pos[0] < mouse_pos[0] < reset_pos[0] + reset_size[0] and reset_pos[1] < mouse_pos[1] < reset_pos[1] + reset_size[1]:
-                    gamestate = Engine.GameState(WIDTH, HEIGHT, SQ_SIZE, gamestate.games_won)
+                    gamestate = Engine.GameState(gamestate.games_won)
                     legal_moves = gamestate.get_legal_moves()
                     sq_selected = ()
                     mouse_clicks = []
@@ -142,7 +139,9 @@ def main():
                 AI_thinking = True
                 print("thinking...")
                 return_queue = Queue()  # used to pass data between threads
-                move_finder_process = Process(target=SmartMoveFinder.find_best_move, args=(gamestate, legal_moves, return_queue))
+                move_finder_process = Process(target=SmartMoveFinder.find_best_move,
+                                              args=(gamestate, legal_moves, return_queue, THINK_TIME, None,
+                                                    SEARCH_WORKERS, transposition_table))
                 move_finder_process.start()  # call find_best_move(gamestate, legal_moves, return_queue)
 
             if not move_finder_process.is_alive():
@@ -191,8 +190,9 @@ def main():
             Display.display_game_over(screen, gamestate, "Draw!")
 
         if game_over and play_alap and (not white_human and not black_human):  # play forever
-            gamestate = Engine.GameState(WIDTH, HEIGHT, SQ_SIZE, gamestate.games_won)
+            gamestate = Engine.GameState(gamestate.games_won)
             legal_moves = gamestate.get_legal_moves()
+            transposition_table.clear()
             game_over = False
             print("==================================================================\n"
                   "======================   NEW GAME   ==============================\n"
@@ -201,6 +201,10 @@ def main():
         clock.tick(FPS)
         p.display.flip()
 
+    if move_finder_process is not None:
+        move_finder_process.join()
+    transposition_table.close()
+
 
 def play_sound(sound_name, volume):
     sound = p.mixer.Sound('sounds/' + sound_name + '.mp3')
@@ -209,4 +213,13 @@ def play_sound(sound_name, volume):
 
 
 if __name__ == "__main__":
+    # the GUI is only imported here, the search process imports this file as __mp_main__ and skips it
+    import pygame as p
+    from win32api import GetSystemMetrics
+    import Display
+
+    WIDTH = GetSystemMetrics(0)
+    HEIGHT = GetSystemMetrics(1)
+    BOARDGAP = HEIGHT // 10
+    SQ_SIZE = (HEIGHT - 2 * BOARDGAP) // 8
     main()
\ No newline at end of file
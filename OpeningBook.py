@@ -0,0 +1,120 @@
+"""
+Opening book, compiled once into a table keyed by zobrist key
+- every line is played through a GameState the first time the book is used, so a lookup is one dict probe
+- an entry is (opening name, [(move, weight), ...]), lines that reach the same position add up their weights
+- the moves are the interned Engine moves, the same objects get_legal_moves returns for the position
+- positions past the hand written lines go to the PGN built book in BinaryBook
+"""
+import random
+
+import BinaryBook
+import Engine
+
+# white's first move, the repeats bias the book towards e4 and d4
+FIRST_MOVES = ['c4', 'd4', 'e4', 'Nf3', 'd4', 'e4', 'd4', 'e4']
+
+# black's replies to white's first move
+FIRST_REPLIES = {'Nf3': ('Reti Opening', ['Nf6', 'd5', 'c5', 'g6']),
+                 'c4': ('English Opening', ['c5', 'e5', 'Nf6', 'e6']),
+                 'd4': ("Queen's Pawn Opening", ['Nf6', 'd5', 'e6', 'd6', 'f5', 'g6', 'c5']),
+                 'e4': ("King's Pawn Opening", ['Nf6', 'd5', 'e6', 'd6', 'g6', 'c5', 'e5', 'c6']),
+                 'f4': ("Bird's opening", ['d5', 'Nf6', 'e6', 'g6', 'c5'])}
+
+# name, the moves of the line and the alternatives at the end of it
+LINES = [
+    ("King's Pawn Opening", 'e4 e5', ('Nf3', 'd4', 'Nc3')),
+    ('Ruy Lopez Opening', 'e4 e5 Nf3 Nc6 Bb5', ('a6', 'Nf6')),
+    ('French Defence', 'e4 e6 d4 d5', ('Nc3', 'Nd2', 'e5', 'exd5')),
+    ('Caro-Kann Defence', 'e4 c6 d4 d5', ('Nc3', 'Nd2', 'e5', 'exd5')),
+    ("King's Gambit", 'e4 e5 f4 exf4 Nf3', ('g5', 'd5', 'd6')),
+    ("Réti Opening: King's Indian Attack", 'Nf3 Nf6 g3', ('g6', 'd5')),
+    ('Réti Opening', 'Nf3 d5', ('d4', 'g3', 'c4', 'b3', 'e3')),
+    ("Queen's Gambit", 'd4 d5 c4', ('c6', 'e6', 'dxc4')),
+    ('English Opening: Symmetrical', 'c4 c5 Nf3 Nf6 Nc3', ()),
+    ("English Opening: King's English", 'c4 e5', ('Nc3', 'g3', 'e3')),
+    ('Modern Defence', 'e4 g6 d4 Bg7', ('Nc3', 'Nf3', 'c4')),
+    ('Dutch Defence', 'd4 f5 g3 Nf6 Bg2 g6', ('Nf3', 'c3', 'c4', 'Nd2')),
+    ('Sicilian Defence: Accelerated Dragon', 'e4 c5 Nf3 g6 d4 cxd4 Nxd4 Nc6', ('Nc3', 'c4')),
+    ('Scandinavian Defence', 'e4 d5 exd5 Qxd5 Nc3 Qa5', ('d4', 'Bc4', 'Nf3', 'g3')),
+    ('Indian Game: East Indian Defence', 'c4 e6 d4 Nf6', ('Nf3', 'Nc3', 'g3')),
+    ('Old Benoni Defence', 'd4 c5 d5', ('e5', 'Nf6', 'd6', 'g6')),
+    ("English Opening, King's Knight", 'c4 Nf6 Nf3', ('g6', 'e6', 'c5', 'c6', 'b6', 'd6')),
+    ('Pirc Defence', 'e4 d6 d4 Nf6 Nc3 g6', ('f4', 'Nf3', 'Be3', 'Bg5', 'g3')),
+    ('Sicilian Defence: Open', 'e4 c5 Nf3 Nc6 d4 cxd4 Nxd4', ('Nf6', 'e6', 'g6', 'e5', 'Qb6', 'Qc7')),
+    ('Sicilian Defence: Najdorf', 'e4 c5 Nf3 d6 d4 cxd4 Nxd4 Nf6 Nc3 a6',
+     ('Bg5', 'Be3', 'Be2', 'Bc4', 'h3', 'h4', 'g3', 'f3', 'a4')),
+    ('Réti Opening: Nimzo-Larsen', 'Nf3 Nf6 b3', ('d5', 'g6', 'c5')),
+    ("King's Indian: Normal", 'd4 d6 Nf3 Nf6 c4 g6 Nc3 Bg7 e4 0-0', ('Be2', 'h3', 'Be3')),
+    ("Queen's Pawn: Symmetrical", 'Nf3 d5 d4 Nf6 c4', ('c6', 'e6', 'dxc4', 'g6')),
+]
+
+book = None  # zobrist key -> (opening name, [(move, weight), ...]), compiled by get_book
+
+
+def get_book():
+    global book
+    if book is None:
+        book = compile_book()
+    return book
+
+
+def compile_book():
+    compiled = {}
+    gamestate = Engine.GameState()
+    for notation in FIRST_MOVES:
+        add_book_move(compiled, gamestate, notation, '')
+    for first_move, (name, replies) in FIRST_REPLIES.items():
+        gamestate.make_move(get_legal_move(gamestate, first_move))
+        for notation in replies:
+            add_book_move(compiled, gamestate, notation, name)
+        gamestate.undo_move()
+    for name, line, alternatives in LINES:
+        gamestate = Engine.GameState()
+        for ply, notation in enumerate(line.split()):
+            if ply >= 2:  # the first two plies come from FIRST_MOVES and FIRST_REPLIES
+                add_book_move(compiled, gamestate, notation, name)
+            gamestate.make_move(get_legal_move(gamestate, notation))
+        for notation in alternatives:
+            add_book_move(compiled, gamestate, notation, name)
+    return compiled
+
+
+def get_legal_move(gamestate, notation):
+    for move in gamestate.get_legal_moves():
+        if move.get_notation() == notation:
+            return move
+    raise ValueError("Book move " + notation + " isn't legal after " +
+                     ' '.join(move.get_notation() for move in gamestate.move_log))
+
+
+def add_book_move(compiled, gamestate, notation, name):
+    move = get_legal_move(gamestate, notation)
+    if gamestate.zobrist_key not in compiled:
+        compiled[gamestate.zobrist_key] = (name, [])
+    candidates = compiled[gamestate.zobrist_key][1]
+    for i, (candidate, weight) in enumerate(candidates):
+        if candidate == move:
+            candidates[i] = (candidate, weight + 1)
+            return
+    candidates.append((move, 1))
+
+
+def get_book_entry(gamestate):
+    # (opening name, [(move, weight), ...]) for the position, None if it's out of book
+    return get_book().get(gamestate.zobrist_key)
+
+
+def get_book_move(gamestate):
+    # a weighted random book move and the opening name, (None, '') out of book
+    # past the hand written lines, the binary book built from PGN games is asked, if there is one
+    entry = get_book_entry(gamestate)
+    if entry is None:
+        binary_book = BinaryBook.get_binary_book()
+        candidates = binary_book.get_book_moves(gamestate) if binary_book else []
+        if not candidates:
+            return None, ''
+        name = ''
+    else:
+        name, candidates = entry
+    move = random.choices([move for move, _ in candidates], [weight for _, weight in candidates])[0]
+    return move, name
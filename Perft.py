@@ -0,0 +1,104 @@
+"""
+Perft, counts the leaf nodes of the move tree to a fixed depth and compares them with the published values
+- run this file to check the move generator on the standard positions, see --help for the options
+- divide prints the count under every root move, to find the move where a wrong count comes from
+- the root moves can be split across a process pool for the deep runs
+"""
+import argparse
+import multiprocessing
+import time
+
+import Engine
+
+# name, FEN and the published node counts for depth 1, 2, 3...
+POSITIONS = [
+    ("start", Engine.START_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(gamestate, depth):
+    legal_moves = gamestate.get_legal_moves()
+    if depth <= 1:
+        return len(legal_moves) if depth == 1 else 1  # bulk count the last ply
+    nodes = 0
+    for move in legal_moves:
+        gamestate.make_move(move)
+        nodes += perft(gamestate, depth - 1)
+        gamestate.undo_move()
+    return nodes
+
+
+def get_move_name(move):
+    # coordinate notation, e2e4 or a7a8q, unambiguous without the position
+    promotion = Engine.int_to_string[move.promote_to][1] if move.is_pawn_promotion else ''
+    return Engine.get_rank_file(move.start_row, move.start_col) + Engine.get_rank_file(move.end_row, move.end_col) + \
+        promotion
+
+
+def perft_root_move(args):
+    # pool worker, every process sets up its own GameState from the FEN
+    fen, move, depth, use_bitboards = args
+    gamestate = Engine.GameState.from_fen(fen, use_bitboards=use_bitboards)
+    gamestate.make_move(move)
+    return perft(gamestate, depth - 1)
+
+
+def divide(fen, depth, processes=1, use_bitboards=False):
+    # node count under every root move, as a list of (move name, nodes)
+    gamestate = Engine.GameState.from_fen(fen, use_bitboards=use_bitboards)
+    legal_moves = gamestate.get_legal_moves()
+    if processes > 1 and depth > 1:
+        with multiprocessing.Pool(processes) as pool:
+            counts = pool.map(perft_root_move, [(fen, move, depth, use_bitboards) for move in legal_moves])
+    else:
+        counts = []
+        for move in legal_moves:
+            gamestate.make_move(move)
+            counts.append(perft(gamestate, depth - 1))
+            gamestate.undo_move()
+    return [(get_move_name(move), nodes) for move, nodes in zip(legal_moves, counts)]
+
+
+def run_suite(max_depth, processes=1, use_bitboards=False):
+    # every standard position to max_depth, returns False if any count is off
+    all_passed = True
+    for name, fen, expected in POSITIONS:
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            start = time.perf_counter()
+            nodes = sum(nodes for _, nodes in divide(fen, depth, processes, use_bitboards))
+            elapsed = time.perf_counter() - start
+            passed = nodes == expected[depth - 1]
+            all_passed = all_passed and passed
+            print("%-10s depth %d: %10d nodes, expected %10d %s %8.2fs %9.0f nps" %
+                  (name, depth, nodes, expected[depth - 1], "ok  " if passed else "FAIL", elapsed,
+                   nodes / max(elapsed, 1e-9)))
+    return all_passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft and divide for the move generator")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fen", help="divide this position instead of running the standard suite")
+    parser.add_argument("--processes", type=int, default=1, help="split the root moves across this many processes")
+    parser.add_argument("--bitboards", action="store_true", help="use the Bitboards reference move generator, slower")
+    args = parser.parse_args()
+    if args.fen:
+        start = time.perf_counter()
+        counts = divide(args.fen, args.depth, args.processes, args.bitboards)
+        elapsed = time.perf_counter() - start
+        for name, nodes in counts:
+            print("%s: %d" % (name, nodes))
+        total = sum(nodes for _, nodes in counts)
+        print("\nmoves %d, nodes %d, %.2fs, %.0f nps" % (len(counts), total, elapsed, total / max(elapsed, 1e-9)))
+    elif not run_suite(args.depth, args.processes, args.bitboards):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
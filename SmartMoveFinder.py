@@ -3,7 +3,10 @@ Responsible for finding a good move for the AI
 """
 
 import random as r
+import time
 
+import Mailbox
+import TranspositionTable
 
 piece_values = {6: 0, 5: 9, 4: 3, 3: 3, 2: 5, 1: 1}
 # black wants a negative score, white positive
@@ -11,7 +14,61 @@ CHECKMATE = 1000
 STALEMATE = 0
 CPU_PERFORMANCE = 10
 ENDGAME = False
-BOARD_HASH = {}
+TT_MEGABYTES = 32  # memory budget of the transposition table
+MAX_DEPTH = 64  # iterative deepening stops here if the budget hasn't run out
+search_deadline = float('inf')  # perf_counter time the search has to stop at
+search_node_limit = float('inf')  # counter value the search has to stop at
+counter = 0  # boardstates searched by the negamax
+quiescence_counter = 0  # boardstates searched past the horizon, captures only
+transposition_table = None  # made by the first search in a process, or the shared table find_best_move is given
+NULL_WINDOW = 0.001  # width of the windows the moves after the first are tried with, scores are fractions of a pawn
+ASPIRATION_WINDOW = 0.5  # the root searches previous score +- this, widened 4x on every fail
+next_move_score = -CHECKMATE  # score of next_move at the root
+pvs_researches = 0  # moves that failed high on the null window and were searched again
+aspiration_researches = 0  # root searches repeated because the score fell outside the aspiration window
+DETERMINISTIC = False  # True orders equal moves the same way every search, for reproducible runs
+HISTORY_MAX = 40000  # history scores are halved past this, so they stay below the killers and checks
+killer_moves = [[None, None] for _ in range(MAX_DEPTH)]  # the last two quiet moves that cut off at each ply
+history_scores = [0] * (13 * 120)  # (piece_moved + 6) * 120 + end_sq -> depth * depth of every quiet cutoff
+search_root_ply = 0  # length of the move log at the root, the ply of a node is counted from here, null moves included
+NULL_MOVE_PRUNING = True  # pass the turn, if the reduced search still fails high the node is cut
+NULL_MOVE_REDUCTION = 2  # the null move is searched this much shallower, on top of the ply it takes
+NULL_MOVE_MIN_DEPTH = 3
+LATE_MOVE_REDUCTIONS = True  # quiet moves late in the ordering are searched shallower first
+LMR_FULL_MOVES = 3  # moves searched at full depth before the reductions start
+LMR_MIN_DEPTH = 3
+LMR_REDUCTION = 1  # 1 ply, 2 past the first 12 moves
+null_move_tries = 0
+null_move_cutoffs = 0
+late_move_reductions = 0
+late_move_researches = 0  # reduced moves that beat alpha and were searched again at full depth
+MATERIAL_WEIGHT = 1.2  # material balance / this is the material part of score_board
+LAZY_MARGIN = 4  # most the positional terms of score_board move it, 3.45 covers 99% of positions from random games
+FUTILITY_PRUNING = True  # at depth 1 and 2, skip quiet moves that can't bring the static score up to alpha
+FUTILITY_MARGINS = (0, 2, 3.5)  # by depth, the most a quiet move and the replies left are expected to gain
+RAZORING = True  # at depth 1 and 2, drop into the quiescence search when the static score is far below alpha
+RAZOR_MARGINS = (0, 3, 4)
+lazy_evaluations = 0  # score_board_lazy returned the material alone
+full_evaluations = 0
+futility_prunes = 0
+razor_cutoffs = 0
+SEE_PRUNING = True  # drop captures the static exchange says lose material, in the quiescence search and at depth 1 and 2
+see_prunes = 0
+CHECK_DEBUG = False  # check the in_check every node is given against a full check test, the pruning is off in check
+SEARCH_WORKERS = 1  # processes find_best_move splits the root moves across
+print_best_moves = True  # the root prints every new best move, off in the pool workers
+depth_results = []  # (depth, best move, score) of every depth the last iterative deepening finished
+# the counters reset_search_stats zeroes and the pool workers send back, by the names of the globals
+SEARCH_STATS = ('counter', 'quiescence_counter', 'pvs_researches', 'aspiration_researches', 'null_move_tries',
+                'null_move_cutoffs', 'late_move_reductions', 'late_move_researches', 'lazy_evaluations',
+                'full_evaluations', 'futility_prunes', 'razor_cutoffs', 'see_prunes')
+TABLE_STATS = ('probes', 'hits', 'collisions', 'stores')  # counters of the TranspositionTable
+
+
+class SearchTimeout(Exception):
+    # raised inside the negamax when the time or node budget runs out
+    pass
+
 
 knight_scores = [[1, 0, 1, 1, 1, 1, 0, 1],
                  [1, 2, 2, 2, 2, 2, 2, 1],
@@ -107,12 +164,15 @@ black_square_control = [[1, 1, 1, 1, 1, 1, 1, 1],
 piece_position_scores = {3: knight_scores, 6: opening_king_scores if not ENDGAME else endgame_king_scores,
                          5: queen_scores, 2: rook_scores, 4: bishop_scores, 1: white_pawn_scores,
                          -1: black_pawn_scores}
+# the same scores indexed by mailbox square
+mailbox_position_scores = {piece: Mailbox.new_mailbox(scores) for piece, scores in piece_position_scores.items()}
 
-rook_directions = [[1, 0], [-1, 0], [0, 1], [0, -1]]
-bishop_directions = [[1, 1], [1, -1], [-1, -1], [-1, 1]]
-queen_directions = [[1, 0], [-1, 0], [0, 1], [0, -1], [1, 1], [1, -1], [-1, -1], [-1, 1]]
-knight_directions = [[2, 1], [2, -1], [-2, 1], [-2, -1], [1, 2], [-1, 2], [1, -2], [-1, -2]]
-king_directions = [[1, 0], [-1, 0], [0, 1], [0, -1], [1, 1], [1, -1], [-1, -1], [-1, 1]]
+# directions as mailbox offsets
+rook_directions = [10, -10, 1, -1]
+bishop_directions = [11, 9, -11, -9]
+queen_directions = [10, -10, 1, -1, 11, 9, -11, -9]
+knight_directions = [21, 19, -19, -21, 12, -8, 8, -12]
+king_directions = [10, -10, 1, -1, 11, 9, -11, -9]
 
 piece_directions = {2: rook_directions, 4: bishop_directions, 5: queen_directions, 3: knight_directions, 6: king_directions}
 
@@ -121,31 +181,52 @@ def find_random_move(legal_moves):
     return legal_moves[r.randint(0, len(legal_moves) - 1)]
 
 
-def find_best_move(gamestate, legal_moves, return_queue):
-    global next_move, counter, ENDGAME, BOARD_HASH, board_state_copies
+def find_best_move(gamestate, legal_moves, return_queue, time_limit=None, node_limit=None, workers=None,
+                   table=None):
+    # time_limit in seconds and node_limit bound the search, without either it searches to depth 4, 5 in the endgame
+    # with more than one worker the root moves are searched in parallel, see find_move_parallel, None is SEARCH_WORKERS
+    # table is a shared TranspositionTable to search with, so the next move starts from what this one learned,
+    # it is only used for this call, the caller may close it afterwards
+    global transposition_table
+    if workers is None:
+        workers = SEARCH_WORKERS
+    if transposition_table is None:
+        transposition_table = TranspositionTable.TranspositionTable(TT_MEGABYTES)
+    process_table = transposition_table
+    if table is not None:
+        transposition_table = table
+    try:
+        result = search_best_move(gamestate, legal_moves, time_limit, node_limit, workers)
+    finally:
+        transposition_table = process_table
+    return_queue.put(result)
+
+
+def search_best_move(gamestate, legal_moves, time_limit, node_limit, workers):
+    # the book move or the searched move, as (move, (boardstates, depth), opening name, in opening)
+    global next_move, ENDGAME
+    transposition_table.new_search()
+    new_move_ordering()
     next_move = None
     actual_depth = 1
     opening_name = gamestate.opening
     in_opening = False
-    counter = 0
+    reset_search_stats()
     if len(legal_moves) == 1:
         next_move = legal_moves[0]
-    board_state_copies = 0
+    max_depth = MAX_DEPTH if time_limit or node_limit else 4 if not gamestate.endgame else 5
     if not next_move:
 
         if gamestate.in_opening:  # opening
             print("In opening prep:", str(gamestate.in_opening))
             next_move_in_opening, opening_name, in_opening = gamestate.get_opening()
-            if next_move_in_opening:
-                for move in legal_moves:
-                    if move.get_notation() == next_move_in_opening:  # check if this move results in the same notation the opening line move is
-                        next_move = move
-                        break
+            if next_move_in_opening in legal_moves:  # book moves are the same interned moves the generator returns
+                next_move = next_move_in_opening
 
         if not next_move:
             gamestate.in_opening = False
-            actual_depth = 4 if not gamestate.endgame else 5
-            find_move_nega_max_alpha_beta(gamestate, legal_moves, actual_depth, -CHECKMATE, CHECKMATE, 1 if gamestate.white_to_move else -1, actual_depth)
+            next_move, actual_depth = find_move_parallel(gamestate, legal_moves, max_depth, time_limit, node_limit,
+                                                         workers)
         # check if the move leads to a draw, if so, change if it is a winning position
         if next_move is not None:
             if len(gamestate.move_log) > 8:
@@ -158,14 +239,21 @@ def find_best_move(gamestate, legal_moves, return_queue):
                         # position good enough to play for a win
                         print("This position is good enough to play for a win")
                         legal_moves_best_removed = remove_legal_move(legal_moves, next_move)
-                        find_move_nega_max_alpha_beta(gamestate, legal_moves_best_removed, actual_depth, -CHECKMATE,
-                                                      CHECKMATE, 1 if gamestate.white_to_move else -1, actual_depth)
+                        if legal_moves_best_removed:
+                            next_move = find_move_parallel(gamestate, legal_moves_best_removed, max_depth, time_limit,
+                                                           node_limit, workers)[0]
                     else:
                         print("This position is not good enough to play for a win...")
                 else:
                     print("Best move isn't threefold repetition!")
-        print("Looked at", counter, "boardstates,", board_state_copies, "skipped copies, depth", actual_depth)
-    return_queue.put((next_move, (counter, actual_depth), opening_name, in_opening))
+        print("Looked at", counter, "boardstates and", quiescence_counter, "quiescence boardstates, depth", actual_depth)
+        print("PVS re-searches", pvs_researches, "aspiration re-searches", aspiration_researches)
+        print("null moves", null_move_tries, "cutoffs", null_move_cutoffs, "late move reductions",
+              late_move_reductions, "re-searches", late_move_researches)
+        print("lazy evaluations", lazy_evaluations, "full evaluations", full_evaluations, "futility prunes",
+              futility_prunes, "razor cutoffs", razor_cutoffs, "losing captures pruned", see_prunes)
+        print(transposition_table.get_stats())
+    return next_move, (counter, actual_depth), opening_name, in_opening
 
 
 def remove_legal_move(legal_moves, move_to_remove):
@@ -178,70 +266,401 @@ def remove_legal_move(legal_moves, move_to_remove):
     return new_legal_moves
 
 
-def find_move_nega_max_alpha_beta(gamestate, legal_moves, depth, alpha, beta, turn_mult, actual_depth):
-    global next_move, counter, ENDGAME, BOARD_HASH, board_state_copies
+def find_move_parallel(gamestate, legal_moves, max_depth, time_limit=None, node_limit=None, workers=1):
+    # root splitting, the root moves are dealt out across a pool of processes that each run the iterative deepening
+    # on their share, and the node limit is split between them
+    # the workers share the transposition table, a private table is swapped for a shared one for the search
+    # the scores are compared at the deepest depth every worker finished, a mate score counts for any depth after it
+    global next_move, transposition_table
+    if workers <= 1 or len(legal_moves) < 2:
+        return find_move_iterative_deepening(gamestate, legal_moves, max_depth, time_limit, node_limit)
+    import multiprocessing  # only here, it would double the import time of the module
+    sorted_moves = sort_legal_moves(legal_moves, gamestate)  # so the likely best moves go to different workers
+    workers = min(workers, len(sorted_moves))
+    worker_node_limit = node_limit // workers if node_limit else None
+    private_table = transposition_table
+    if private_table is None or private_table.memory is None:  # only for this search
+        transposition_table = TranspositionTable.TranspositionTable(TT_MEGABYTES, shared=True)
+        transposition_table.new_search()
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            worker_results = pool.map(search_root_moves, [(gamestate, sorted_moves[i::workers], max_depth, time_limit,
+                                                           worker_node_limit, transposition_table)
+                                                          for i in range(workers)])
+    finally:
+        if transposition_table is not private_table:
+            transposition_table.close()
+            transposition_table = private_table or TranspositionTable.TranspositionTable(TT_MEGABYTES)
+    finished_depths = [results[-1][0] for results, _ in worker_results
+                       if results and abs(results[-1][2]) < CHECKMATE]
+    common_depth = min(finished_depths) if finished_depths else max_depth
+    best_move = sorted_moves[0]  # if no worker finished depth 1
+    best_score = None
+    finished_depth = 0
+    for results, stats in worker_results:
+        add_search_stats(stats)
+        if results and abs(results[-1][2]) >= CHECKMATE:
+            finished = results[-1:]  # a mate holds at every depth from the one it was found at
+        else:
+            finished = [result for result in results if result[0] <= common_depth]
+        if finished:
+            depth, move, score = finished[-1]
+            finished_depth = max(finished_depth, depth)
+            if best_score is None or score > best_score:
+                best_move = move
+                best_score = score
+    next_move = best_move
+    return best_move, finished_depth
+
+
+def search_root_moves(args):
+    # pool worker, the iterative deepening over one share of the root moves, on the shared transposition table
+    # returns the depth results and the search stats of the worker, for find_move_parallel to add up
+    global transposition_table, print_best_moves
+    gamestate, root_moves, max_depth, time_limit, node_limit, table = args
+    transposition_table = table
+    transposition_table.reset_stats()  # the process that started the search has aged the table
+    new_move_ordering()
+    print_best_moves = False
+    reset_search_stats()
+    find_move_iterative_deepening(gamestate, root_moves, max_depth, time_limit, node_limit)
+    return depth_results, get_search_stats()
+
+
+def reset_search_stats():
+    globals().update(dict.fromkeys(SEARCH_STATS, 0))
+
+
+def get_search_stats():
+    # {name: value} of every counter of this search and of the transposition table stats
+    stats = {name: globals()[name] for name in SEARCH_STATS}
+    for name in TABLE_STATS:
+        stats["tt_" + name] = getattr(transposition_table, name)
+    return stats
+
+
+def add_search_stats(stats):
+    # adds the stats a pool worker sent back to the ones of this process
+    for name in SEARCH_STATS:
+        globals()[name] += stats[name]
+    for name in TABLE_STATS:
+        setattr(transposition_table, name, getattr(transposition_table, name) + stats["tt_" + name])
+
+
+def find_move_iterative_deepening(gamestate, legal_moves, max_depth, time_limit=None, node_limit=None):
+    # searches depth 1, 2, 3... until max_depth or the budget runs out, returns (best move, last finished depth)
+    # every depth starts from the best move of the one before, through the transposition table,
+    # in a window around the score of the one before that is widened if the score falls outside
+    global next_move, next_move_score, search_deadline, search_node_limit, search_root_ply, aspiration_researches, \
+        depth_results
+    start = time.perf_counter()
+    search_deadline = start + time_limit if time_limit else float('inf')
+    search_node_limit = counter + node_limit if node_limit else float('inf')
+    search_root_ply = len(gamestate.move_log)
+    turn_mult = 1 if gamestate.white_to_move else -1
+    in_check = gamestate.check_for_pins_and_checks()[0]  # the root moves come from the caller
+    best_move = legal_moves[0]  # a move is ready even if depth 1 doesn't finish
+    finished_depth = 0
+    depth_results = []
+    score = 0
+    for depth in range(1, max_depth + 1):
+        window = ASPIRATION_WINDOW
+        if depth > 1 and abs(score) < CHECKMATE:
+            alpha = max(score - window, -CHECKMATE)
+            beta = min(score + window, CHECKMATE)
+        else:
+            alpha = -CHECKMATE
+            beta = CHECKMATE
+        try:
+            while True:
+                next_move = None
+                next_move_score = -CHECKMATE
+                score = find_move_nega_max_alpha_beta(gamestate, list(legal_moves), depth, alpha, beta, turn_mult,
+                                                      depth, in_check)
+                if score <= alpha and alpha > -CHECKMATE:  # failed low, every move is worse than expected
+                    alpha = max(score - window, -CHECKMATE)
+                elif score >= beta and beta < CHECKMATE:  # failed high
+                    beta = min(score + window, CHECKMATE)
+                else:
+                    break
+                window *= 4
+                aspiration_researches += 1
+        except SearchTimeout:
+            gamestate.undo_to_ply(search_root_ply)
+            # the last best move is searched first, so a move that beat alpha is better
+            if next_move is not None and next_move_score > alpha:
+                best_move = next_move
+            break
+        if next_move is not None:  # None if every move gets mated
+            best_move = next_move
+        finished_depth = depth
+        depth_results.append((depth, best_move, score))
+        if abs(score) >= CHECKMATE:
+            break  # found a mate, or all moves get mated
+        if time_limit and time.perf_counter() - start > time_limit / 2:
+            break  # the next depth would take longer than the time that's left
+    next_move = best_move
+    search_deadline = float('inf')
+    search_node_limit = float('inf')
+    return best_move, finished_depth
+
+
+def find_move_nega_max_alpha_beta(gamestate, legal_moves, depth, alpha, beta, turn_mult, actual_depth, in_check,
+                                  null_move_allowed=True):
+    # principal variation search, the first move gets the full window and the rest a null window around alpha,
+    # only a move that beats alpha on the null window is searched again with the full window
+    # in_check is what the get_legal_moves that made legal_moves found, the parent keeps it for the re-searches
+    # null_move_allowed is False right after a null move, two in a row would just give the turn back
+    global next_move, next_move_score, counter, pvs_researches, null_move_tries, null_move_cutoffs, \
+        late_move_reductions, late_move_researches, futility_prunes, razor_cutoffs, see_prunes, ENDGAME
     if depth == 0:
+        return find_move_quiescence(gamestate, alpha, beta, turn_mult)
+    # a re-search gets the flags the last node below it left, so they are set again from legal_moves
+    gamestate.in_check = in_check
+    gamestate.checkmate = in_check and not legal_moves
+    gamestate.draw = not in_check and not legal_moves
+    if CHECK_DEBUG:
+        assert in_check == gamestate.check_for_pins_and_checks()[0], gamestate.to_fen()
+    if not legal_moves:
         return turn_mult * score_board(gamestate)
 
-    sorted_moves = sort_legal_moves(legal_moves, gamestate)
+    # transposition table, the root is always searched so that it sets next_move
+    key = gamestate.zobrist_key
+    original_alpha = alpha
+    entry = transposition_table.probe(key)
+    hash_move = None
+    if entry is not None:
+        entry_depth, bound, entry_score, hash_move = entry
+        if entry_depth >= depth and depth != actual_depth:
+            if bound == TranspositionTable.EXACT:
+                return entry_score
+            if bound == TranspositionTable.LOWER:
+                alpha = max(alpha, entry_score)
+            else:
+                beta = min(beta, entry_score)
+            if alpha >= beta:
+                return entry_score
+
+    root = depth == actual_depth
+    ply = len(gamestate.move_log) + len(gamestate.null_move_log) - search_root_ply
+
+    # the static score decides the pruning below, razoring, null move, futility and SEE pruning all need it,
+    # so none of them runs in check where every move has to be looked at
+    static_score = None
+    if not root and not in_check:
+        static_score = score_board_lazy(gamestate, alpha, beta, turn_mult)
+
+    # razoring, far below alpha near the horizon only captures can save the node
+    if RAZORING and depth <= 2 and static_score is not None and alpha > -CHECKMATE and \
+            static_score + RAZOR_MARGINS[depth] <= alpha:
+        razor_alpha = alpha - RAZOR_MARGINS[depth]
+        score = find_move_quiescence(gamestate, razor_alpha, razor_alpha + NULL_WINDOW, turn_mult)
+        if score <= razor_alpha:
+            razor_cutoffs += 1
+            return score
+
+    # null move, if passing still fails high on a shallower search, a real move will too
+    # not in check where passing is illegal, and not in the endgame where zugzwang makes passing the better move
+    if NULL_MOVE_PRUNING and null_move_allowed and static_score is not None and not gamestate.endgame and \
+            depth >= NULL_MOVE_MIN_DEPTH and beta < CHECKMATE and static_score >= beta:
+        null_move_tries += 1
+        gamestate.make_null_move()
+        null_depth = max(depth - 1 - NULL_MOVE_REDUCTION, 0)
+        next_moves = gamestate.get_legal_moves() if null_depth > 0 else None
+        score = -find_move_nega_max_alpha_beta(gamestate, next_moves, null_depth, -beta, -beta + NULL_WINDOW,
+                                               -turn_mult, actual_depth, null_depth > 0 and gamestate.in_check, False)
+        gamestate.undo_null_move()
+        if score >= beta:
+            null_move_cutoffs += 1
+            return beta  # not the score itself, a mate found after passing isn't a real mate
+
+    # near the horizon, quiet moves that can't make up a static score this far below alpha are futile,
+    # and so are captures that lose material, unless they give check
+    futility_score = None
+    see_pruning = SEE_PRUNING and depth <= 2 and static_score is not None
+    if FUTILITY_PRUNING and depth <= 2 and static_score is not None and alpha > -CHECKMATE and \
+            static_score + FUTILITY_MARGINS[depth] <= alpha:
+        futility_score = static_score + FUTILITY_MARGINS[depth]
+    if futility_score is not None or see_pruning:
+        check_info = gamestate.get_check_info()
+
+    sorted_moves = sort_legal_moves(legal_moves, gamestate, hash_move, ply)
+    killers = killer_moves[ply]
 
     max_score = -CHECKMATE
-    for move in sorted_moves:
+    best_move = None
+    for move_number, move in enumerate(sorted_moves):
+        if futility_score is not None and best_move is not None and not move.piece_captured and \
+                not move.is_pawn_promotion and not gamestate.gives_check(move, check_info):
+            futility_prunes += 1
+            if futility_score > max_score:
+                max_score = futility_score  # what the skipped moves could have scored at most
+            continue
+        if see_pruning and best_move is not None and move.piece_captured and is_losing_capture(move, gamestate) \
+                and not gamestate.gives_check(move, check_info):
+            see_prunes += 1
+            continue
         counter += 1
+        if counter >= search_node_limit or (counter & 255 == 0 and time.perf_counter() > search_deadline):
+            raise SearchTimeout
         gamestate.make_move(move)
-        next_moves = gamestate.get_legal_moves()
-        board_state = gamestate.boardstates_log[-1]
-        if board_state not in BOARD_HASH:
-            # print("New board state")
-            score = -find_move_nega_max_alpha_beta(gamestate, next_moves, depth - 1, -beta, -alpha, -turn_mult, actual_depth)
-            BOARD_HASH[board_state] = score
+        if gamestate.get_draw_by_rule():  # repetition, 50 moves or no mating material
+            score = STALEMATE
         else:
-            # print("Board state already found!")
-            board_state_copies += 1
-            score = BOARD_HASH[board_state]
-            # print("copied board state evaluated as", score)
+            next_moves = gamestate.get_legal_moves() if depth > 1 else None  # leaves don't need the moves
+            next_in_check = depth > 1 and gamestate.in_check  # the quiescence search finds it for itself
+            if best_move is None:
+                score = -find_move_nega_max_alpha_beta(gamestate, next_moves, depth - 1, -beta, -alpha, -turn_mult,
+                                                       actual_depth, next_in_check)
+            else:
+                score = None
+                # late quiet moves that don't give check are tried shallower first
+                if LATE_MOVE_REDUCTIONS and move_number >= LMR_FULL_MOVES and depth >= LMR_MIN_DEPTH and \
+                        not in_check and not next_in_check and not move.piece_captured and \
+                        not move.is_pawn_promotion and move != killers[0] and move != killers[1]:
+                    late_move_reductions += 1
+                    reduction = LMR_REDUCTION if move_number < 12 else LMR_REDUCTION + 1
+                    score = -find_move_nega_max_alpha_beta(gamestate, next_moves, max(depth - 1 - reduction, 1),
+                                                           -alpha - NULL_WINDOW, -alpha, -turn_mult, actual_depth,
+                                                           next_in_check)
+                    if score > alpha:
+                        late_move_researches += 1
+                        score = None
+                if score is None:
+                    score = -find_move_nega_max_alpha_beta(gamestate, next_moves, depth - 1, -alpha - NULL_WINDOW,
+                                                           -alpha, -turn_mult, actual_depth, next_in_check)
+                if alpha < score < beta:
+                    pvs_researches += 1
+                    score = -find_move_nega_max_alpha_beta(gamestate, next_moves, depth - 1, -beta, -alpha,
+                                                           -turn_mult, actual_depth, next_in_check)
         if score > max_score:
             max_score = score
-            if depth == actual_depth:
-                print("new best move", move.get_notation(), "evaluation:", score)
+            best_move = move
+            if root:
+                if print_best_moves:
+                    print("new best move", move.get_notation(), "evaluation:", score)
                 next_move = move
+                next_move_score = score
         gamestate.undo_move()
         if max_score > alpha:  # pruning happens
             alpha = max_score
         if alpha >= beta:
+            if not move.piece_captured and not move.is_pawn_promotion:
+                add_quiet_cutoff(move, depth, ply)
             break
+
+    if max_score <= original_alpha:
+        bound = TranspositionTable.UPPER
+    elif max_score >= beta:
+        bound = TranspositionTable.LOWER
+    else:
+        bound = TranspositionTable.EXACT
+    transposition_table.store(key, depth, bound, max_score, best_move)
     return max_score
 
 
-def sort_legal_moves(legal_moves, gamestate):
-    # move ordering (check more forcing moves first)
-    # only relevant if captures are available aka after first moves
-    if len(gamestate.move_log) >= 2:
-        sorted_moves = []
-        # check each legal move and sort them, captures and checks first
-        for i in range(len(legal_moves) - 1, -1, -1):
-            move = legal_moves[i]
-            gamestate.make_move(move)
-            gamestate.get_legal_moves()  # to update the in check variable
-            if move.piece_captured != 0 or gamestate.in_check:  # move is capture or check
-                sorted_moves.append(move)
-                legal_moves.pop(i)
-            gamestate.undo_move()
-        # then pieces before pawns
-        for i in range(len(legal_moves) - 1, -1, -1):
-            move = legal_moves[i]
-            gamestate.make_move(move)
-            if abs(move.piece_moved) != 1:
-                sorted_moves.append(move)
-                legal_moves.pop(i)
-            gamestate.undo_move()
-        # append the rest to the new list
-        r.shuffle(legal_moves)
-        for unforcing_move in legal_moves:
-            sorted_moves.append(unforcing_move)
+def find_move_quiescence(gamestate, alpha, beta, turn_mult):
+    # captures only past the horizon, so the search doesn't stop in the middle of an exchange
+    global quiescence_counter, see_prunes
+    moves = gamestate.get_capture_moves()  # every legal move when in check
+    if gamestate.in_check:
+        if not moves:  # get_legal_moves has set checkmate
+            return turn_mult * score_board(gamestate)
+        max_score = -CHECKMATE  # no standing pat in check
     else:
-        sorted_moves = legal_moves
-    return sorted_moves
+        if moves:
+            gamestate.checkmate = False
+            gamestate.draw = False
+        else:
+            gamestate.has_legal_move()  # no captures, could be stalemate
+        max_score = score_board_lazy(gamestate, alpha, beta, turn_mult)  # stand pat, capturing isn't forced
+        if max_score >= beta:
+            return max_score
+        if max_score > alpha:
+            alpha = max_score
+
+    in_check = gamestate.in_check
+    moves.sort(key=get_capture_score, reverse=True)
+    for move in moves:
+        if SEE_PRUNING and not in_check and is_losing_capture(move, gamestate):
+            see_prunes += 1
+            continue
+        quiescence_counter += 1
+        if quiescence_counter & 255 == 0 and time.perf_counter() > search_deadline:
+            raise SearchTimeout
+        gamestate.make_move(move)
+        score = -find_move_quiescence(gamestate, -beta, -alpha, -turn_mult)
+        gamestate.undo_move()
+        if score > max_score:
+            max_score = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+    return max_score
+
+
+def sort_legal_moves(legal_moves, gamestate, hash_move=None, ply=0):
+    # best first, from scores that don't need the moves to be made:
+    # the hash move, captures and promotions by MVV-LVA, the killers, checks, then the history of the quiet moves
+    check_info = gamestate.get_check_info()
+    killers = killer_moves[ply]
+    if not DETERMINISTIC:
+        legal_moves = list(legal_moves)
+        r.shuffle(legal_moves)  # moves with the same score come in a random order
+    return sorted(legal_moves, key=lambda move: get_move_score(move, gamestate, check_info, hash_move, killers),
+                  reverse=True)
+
+
+def get_move_score(move, gamestate, check_info, hash_move, killers):
+    if move == hash_move:
+        return 1000000
+    if move.piece_captured or move.is_pawn_promotion:
+        if is_losing_capture(move, gamestate):
+            return -100000 + get_capture_score(move)  # after the quiet moves
+        return 200000 + get_capture_score(move)
+    if move == killers[0]:
+        return 150000
+    if move == killers[1]:
+        return 140000
+    score = history_scores[(move.piece_moved + 6) * 120 + move.end_sq]
+    if gamestate.gives_check(move, check_info):
+        score += 100000
+    return score
+
+
+def get_capture_score(move):
+    # MVV-LVA, most valuable victim first, then least valuable attacker, a promotion counts the piece it promotes to
+    return 100 * (piece_values.get(abs(move.piece_captured), 0) + piece_values.get(abs(move.promote_to), 0)) - \
+        piece_values[abs(move.piece_moved)]
+
+
+def is_losing_capture(move, gamestate):
+    # only a capture with a more valuable piece than the victim can lose material, the rest skip the exchange
+    if piece_values[abs(move.piece_moved)] <= piece_values.get(abs(move.piece_captured), 0):
+        return False
+    return gamestate.get_static_exchange(move) < 0
+
+
+def add_quiet_cutoff(move, depth, ply):
+    # a quiet move refuted the opponent's move, try it early in the sibling positions and wherever it fits
+    global history_scores
+    killers = killer_moves[ply]
+    if move != killers[0]:
+        killers[1] = killers[0]
+        killers[0] = move
+    index = (move.piece_moved + 6) * 120 + move.end_sq
+    history_scores[index] += depth * depth
+    if history_scores[index] > HISTORY_MAX:
+        history_scores = [score // 2 for score in history_scores]
+
+
+def new_move_ordering():
+    # killers belong to the positions of the last search, the history is kept but counts for less
+    global history_scores
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    history_scores = [score // 8 for score in history_scores]
 
 
 """
@@ -249,6 +668,22 @@ Score the board
 """
 
 
+def score_board_lazy(gamestate, alpha, beta, turn_mult):
+    # score_board for the side to move, but when the material alone is so far outside the window
+    # that the positional terms can't bring it back, the bound the full score is known to be past
+    global lazy_evaluations, full_evaluations
+    if not gamestate.checkmate and not gamestate.draw:
+        material = turn_mult * gamestate.material_balance / MATERIAL_WEIGHT
+        if material + LAZY_MARGIN <= alpha:
+            lazy_evaluations += 1
+            return material + LAZY_MARGIN
+        if material - LAZY_MARGIN >= beta:
+            lazy_evaluations += 1
+            return material - LAZY_MARGIN
+    full_evaluations += 1
+    return turn_mult * score_board(gamestate)
+
+
 def score_board(gamestate):
     if gamestate.checkmate:
         if gamestate.white_to_move:
@@ -261,67 +696,52 @@ def score_board(gamestate):
     connected_pawns_weight = 10  # higher = less positional impact
     available_moves = 0
     available_moves_weight = 20
-    material_weight = 1.2
     attacking_score = 0
     attack_weight = 10
     score = 0
     weights_impact = 10  # higher = less positional impact
-    for row in range(8):
-        for col in range(8):
-            square = gamestate.board[row][col]
-            if square != 0:  # not blank
-                white = False
-                if square != 1 and square != -1:
-                    piece_score = piece_position_scores[abs(square)][row][col] / weights_impact
-                else:
-                    piece_score = piece_position_scores[square][row][col] / weights_impact
-                if square > 0:
-                    white = True
-                score += piece_score if white else -piece_score
-                # checking available moves
-                available_move_adder = 1 if square > 0 else -1
-                if abs(square) == 1:  # pawns
-                    move_direction = -1 if square == 1 else 1
-                    if gamestate.board[row + move_direction][col] == 0:
+    mailbox = gamestate.mailbox
+    for sq in Mailbox.SQUARES:
+        square = mailbox[sq]
+        if square != 0:  # not blank
+            white = False
+            if square != 1 and square != -1:
+                piece_score = mailbox_position_scores[abs(square)][sq] / weights_impact
+            else:
+                piece_score = mailbox_position_scores[square][sq] / weights_impact
+            if square > 0:
+                white = True
+            score += piece_score if white else -piece_score
+            # checking available moves
+            available_move_adder = 1 if square > 0 else -1
+            if abs(square) == 1:  # pawns
+                move_direction = -10 if square == 1 else 10
+                if mailbox[sq + move_direction] == 0:
+                    available_moves += available_move_adder
+                capture_directions = [-1, 1]
+                for direction in capture_directions:
+                    pawn_square = mailbox[sq + move_direction + direction]
+                    if pawn_square != 0 and pawn_square != Mailbox.OFF_BOARD:
+                        if (white and pawn_square == 1) or (not white and pawn_square == -1):
+                            connected_pawns_score += pawn_square
+                        elif (white and pawn_square < 0) or (not white and pawn_square > 0):
+                            attacking_score += pawn_square
+            elif 2 <= abs(square) <= 5 and abs(square) != 3:  # all long range pieces excluding nights
+                for direction in piece_directions[abs(square)]:
+                    new_sq = sq + direction
+                    while mailbox[new_sq] == 0:
+                        available_moves += available_move_adder
+                        new_sq += direction
+                    if mailbox[new_sq] != Mailbox.OFF_BOARD and square * mailbox[new_sq] < 0:  # enemy piece
+                        available_moves += available_move_adder
+                        attacking_score += available_move_adder
+            elif abs(square) == 3 or abs(square) == 6:
+                for direction in piece_directions[abs(square)]:
+                    check_square = mailbox[sq + direction]
+                    if check_square == 0:
                         available_moves += available_move_adder
-                    capture_directions = [-1, 1]
-                    for direction in capture_directions:
-                        new_row = row + move_direction
-                        new_col = col + direction
-                        if 0 <= new_row < 8 and 0 <= new_col < 8:
-                            pawn_square = gamestate.board[new_row][new_col]
-                            if pawn_square != 0:
-                                if (white and pawn_square == 1) or (not white and pawn_square == -1):
-                                    connected_pawns_score += pawn_square
-                                elif (white and pawn_square < 0) or (not white and pawn_square > 0):
-                                    attacking_score += pawn_square
-                elif 2 <= abs(square) <= 5 and abs(square) != 3:  # all long range pieces excluding nights
-                    for direction in piece_directions[abs(square)]:
-                        for i in range(1, 8):
-                            new_row = row + direction[0] * i
-                            new_col = col + direction[1] * i
-                            if 0 <= new_row < 8 and 0 <= new_col < 8:
-                                check_square = gamestate.board[new_row][new_col]
-                                if check_square == 0:
-                                    available_moves += available_move_adder
-                                elif square * check_square < 0:  # enemy piece
-                                    available_moves += available_move_adder
-                                    attacking_score += available_move_adder
-                                    break
-                                else:  # piece occupy so can't move there
-                                    break
-                            else:  # outside board so point in checking further
-                                break
-                elif abs(square) == 3 or abs(square) == 6:
-                    for direction in piece_directions[abs(square)]:
-                        new_row = row + direction[0]
-                        new_col = col + direction[1]
-                        if 0 <= new_row < 8 and 0 <= new_col < 8:
-                            check_square = gamestate.board[new_row][new_col]
-                            if check_square == 0:
-                                available_moves += available_move_adder
-                            elif square * check_square < 0:  # enemy piece
-                                attacking_score += available_move_adder
+                    elif check_square != Mailbox.OFF_BOARD and square * check_square < 0:  # enemy piece
+                        attacking_score += available_move_adder
 
     # better position the more options you have generally
     score += available_moves / available_moves_weight
@@ -330,7 +750,7 @@ def score_board(gamestate):
     score += attacking_score / attack_weight
 
     # material score
-    score += gamestate.material_balance / material_weight
+    score += gamestate.material_balance / MATERIAL_WEIGHT
 
     # add points for connected pawn chains
     score += connected_pawns_score / connected_pawns_weight
@@ -343,13 +763,12 @@ def is_inside_board(row, col):
     return False
 
 
-def score_material(board):
+def score_material(mailbox):
     score = 0
-    for row in range(8):
-        for col in range(8):
-            if board[row][col] > 0:
-                score += piece_values[abs(board[row][col])]
-            elif board[row][col] < 0:
-                score -= piece_values[abs(board[row][col])]
+    for sq in Mailbox.SQUARES:
+        if mailbox[sq] > 0:
+            score += piece_values[mailbox[sq]]
+        elif mailbox[sq] < 0:
+            score -= piece_values[-mailbox[sq]]
     return score
 
@@ -0,0 +1,127 @@
+"""
+Transposition table for the search, a fixed number of slots indexed by the low bits of the zobrist key
+- the slots are one flat array of 64 bit words, three per slot: check, data and score
+- data packs depth | bound << 8 | age << 10 | move << 16, the score is stored as a fixed point int
+- the check word is key ^ data ^ score, a slot only counts when the three xor back to the key, so processes can
+  write the same slot at once without locks, a slot torn by two writers just reads as empty
+- the score is exact, or only a lower or an upper bound when it came from an alpha-beta cutoff
+- a slot is replaced by the same position, a deeper search or anything from a newer search
+- a shared table lives in multiprocessing.shared_memory, it pickles as its name, so the search processes
+  and the pool workers all read and write the same slots, and it outlives the process of every move
+- Engine is imported on the first probe, SmartMoveFinder imports this module before Engine can read its piece values
+"""
+EXACT = 0
+LOWER = 1  # the score is at least this, the search failed high
+UPPER = 2  # the score is at most this, the search failed low
+
+ENTRY_BYTES = 24  # three 64 bit words
+SCORE_SCALE = 1000000  # scores are fractions of a pawn, kept to a millionth
+SCORE_OFFSET = 1 << 62  # so negative scores fit the unsigned word
+
+
+class TranspositionTable:
+    def __init__(self, megabytes=32, shared=False, name=None):
+        # name attaches to the shared table another process made
+        size = 1
+        while size * 2 * ENTRY_BYTES <= megabytes * 2 ** 20:
+            size *= 2
+        self.megabytes = megabytes
+        self.size = size
+        self.mask = size - 1
+        table_bytes = size * ENTRY_BYTES + 8  # the age of the table is the last word
+        self.memory = None
+        if shared or name is not None:
+            from multiprocessing import shared_memory  # only shared tables need it
+            self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=table_bytes)
+            self.owner = name is None  # the process that made the table removes it
+            buffer = self.memory.buf[:table_bytes]
+        else:
+            self.owner = True
+            buffer = memoryview(bytearray(table_bytes))
+        self.buffer = buffer
+        self.words = buffer.cast('Q')
+        if self.owner:
+            self.words[size * 3] = 1  # the age starts at 1, a data word of 0 marks an empty slot
+        self.age = self.words[size * 3]
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0  # slot taken by another position, or torn by two writers
+        self.stores = 0
+
+    def __reduce__(self):
+        # a shared table pickles as its name, a private one as a new empty table
+        if self.memory is not None:
+            return TranspositionTable, (self.megabytes, True, self.memory.name)
+        return TranspositionTable, (self.megabytes,)
+
+    def new_search(self):
+        # entries from older searches can be replaced by anything, the stats count this search only
+        self.age = self.words[self.size * 3] % 63 + 1
+        self.words[self.size * 3] = self.age
+        self.reset_stats()
+
+    def reset_stats(self):
+        # for a process that joins a search another process started
+        self.age = self.words[self.size * 3]
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def clear(self):
+        self.buffer[:self.size * ENTRY_BYTES] = bytes(self.size * ENTRY_BYTES)
+
+    def close(self):
+        # the owner of a shared table frees the memory, the other processes only let go of it
+        if self.memory is not None:
+            memory = self.memory
+            self.detach()
+            if self.owner:
+                memory.unlink()
+
+    def detach(self):
+        # the views on the shared memory have to go before it can be closed
+        if self.memory is not None:
+            self.words.release()
+            self.buffer.release()
+            self.memory.close()
+            self.memory = None
+
+    def __del__(self):
+        self.detach()  # only close() removes the memory, a copy of the owner in a child process must not
+
+    def probe(self, key):
+        # (depth, bound, score, move) for the position, None if it isn't in the table
+        self.probes += 1
+        index = (key & self.mask) * 3
+        words = self.words
+        data = words[index + 1]
+        if not data:
+            return None
+        score = words[index + 2]
+        if words[index] ^ data ^ score != key:
+            self.collisions += 1
+            return None
+        self.hits += 1
+        packed_move = data >> 16
+        import Engine  # after the first probe this is a lookup in sys.modules
+        return data & 255, data >> 8 & 3, (score - SCORE_OFFSET) / SCORE_SCALE, \
+            Engine.get_packed_move(packed_move) if packed_move else None
+
+    def store(self, key, depth, bound, score, move):
+        index = (key & self.mask) * 3
+        words = self.words
+        data = words[index + 1]
+        if data and words[index] ^ data ^ words[index + 2] != key and data >> 10 & 63 == self.age and \
+                data & 255 > depth:
+            return  # keep the deeper result of this search
+        data = depth | bound << 8 | self.age << 10 | (move.packed if move is not None else 0) << 16
+        score = round(score * SCORE_SCALE) + SCORE_OFFSET
+        words[index] = key ^ data ^ score
+        words[index + 1] = data
+        words[index + 2] = score
+        self.stores += 1
+
+    def get_stats(self):
+        return "TT probes %d, hits %d, collisions %d, stores %d, %d slots" % \
+               (self.probes, self.hits, self.collisions, self.stores, self.size)